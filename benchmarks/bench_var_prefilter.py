@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the literal fragment prefilter for VAR and IFB patterns.
+
+Compares searching every VAR/IFB pattern through the BOF buffer, as
+match_formats used to do, with the prefiltered search of the signature
+engine, for a few buffer contents and sizes.
+
+Usage, from the top of the source tree:
+
+    python -m benchmarks.bench_var_prefilter [ROUNDS]
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import re
+import sys
+
+from fido import CONFIG_DIR
+from fido.fido import Fido, PerfTimer
+
+
+def var_patterns(fido):
+    """Return the VAR and IFB patterns of the loaded signatures."""
+    return [pattern for sig in fido.get_signature_engine().signatures
+            for pattern in sig.patterns if pattern.position in ('VAR', 'IFB')]
+
+
+def plain_loop(patterns, buffer):
+    """Search every pattern through the buffer."""
+    return [pattern for pattern in patterns if re.search(pattern.regex, buffer)]
+
+
+def prefiltered_loop(patterns, buffer):
+    """Search only the patterns whose literal fragments are all present."""
+    found = {}
+    matches = []
+    for pattern in patterns:
+        for fragment in pattern.fragments:
+            present = found.get(fragment)
+            if present is None:
+                present = found[fragment] = fragment in buffer
+            if not present:
+                break
+        else:
+            if pattern.test(buffer):
+                matches.append(pattern)
+    return matches
+
+
+def buffers():
+    """Yield (description, buffer) pairs to benchmark against."""
+    rnd = random.Random(1)
+    with open(os.path.join(CONFIG_DIR, 'formats-v116.xml'), 'rb') as xml_file:
+        text = xml_file.read()
+    for size in (128 * 1024, 1024 * 1024):
+        yield 'random %d KiB' % (size // 1024), bytes(bytearray(rnd.getrandbits(8) for _ in range(size)))
+        yield 'text %d KiB' % (size // 1024), text[:size]
+        yield 'zeros %d KiB' % (size // 1024), b'\x00' * size
+
+
+def main(rounds=5):
+    """Run the benchmark and print the timings."""
+    fido = Fido(quiet=True)
+    patterns = var_patterns(fido)
+    re.purge()
+    print('{} VAR/IFB patterns, best of {} rounds'.format(len(patterns), rounds))
+    print('{:<16} {:>12} {:>12} {:>8}'.format('buffer', 'plain (ms)', 'filter (ms)', 'speedup'))
+    for description, buffer in buffers():
+        results = []
+        for loop in (plain_loop, prefiltered_loop):
+            best = None
+            for _ in range(rounds):
+                timer = PerfTimer()
+                matches = loop(patterns, buffer)
+                duration = timer.duration()
+                best = duration if best is None else min(best, duration)
+            results.append((best, [pattern.regex for pattern in matches]))
+        assert results[0][1] == results[1][1], 'prefilter changed the matches'
+        print('{:<16} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(description, results[0][0] * 1000, results[1][0] * 1000, results[0][0] / results[1][0]))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the start-up of FIDO, with and without the signature cache.
+
+Each run starts a new Python process, which loads the default format files
+and reports the time taken by the Fido constructor; the wall time of the
+process is measured as well.  The cache is written by the first cached run.
+
+    python benchmarks/startup.py [-runs N]
+"""
+from __future__ import print_function
+
+from argparse import ArgumentParser
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE = """
+import sys
+from fido.fido import Fido, PerfTimer
+timer = PerfTimer()
+Fido(quiet=True, signature_cache={})
+sys.stdout.write(str(timer.duration()))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(signature_cache):
+    """Start FIDO in a new process, return (time of the constructor, time of the process)."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', CODE.format(signature_cache)], env=env, stderr=open(os.devnull, 'w'))
+    return float(output), time.time() - start
+
+
+def report(label, times):
+    """Print the median times of the runs."""
+    times = sorted(times)
+    init, total = times[len(times) // 2]
+    print('{:<28} Fido() {:7.3f} s   process {:7.3f} s'.format(label, init, total))
+
+
+def main(args=None):
+    """Run the benchmark."""
+    parser = ArgumentParser(description='Benchmark the start-up of FIDO, with and without the signature cache.')
+    parser.add_argument('-runs', type=int, default=5, help='number of runs of each kind (default: 5)')
+    args = parser.parse_args(args)
+
+    directory = tempfile.mkdtemp(prefix='fido-cache-')
+    try:
+        cache = "__import__('fido.cache').cache.SignatureCache({!r})".format(directory)
+        report('XML (no cache)', [run('False') for _ in range(args.runs)])
+        report('XML, writing the cache', [run(cache)])
+        report('cached', [run(cache) for _ in range(args.runs)])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+FIDO: Format Identifier for Digital Objects.
+
+Copyright 2010 The Open Preservation Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+asyncio front end of FIDO, requires Python 3.6 or later.
+
+The blocking reads and matching of Fido.identify run in an executor, the
+default one of the event loop unless another is given, so that they do not
+block the event loop:
+
+    results = await identify_path(fido, 'file.pdf')
+
+    async for result in identify_many(fido, paths, concurrency=16):
+        ...
+"""
+import asyncio
+from collections import deque
+from functools import partial
+
+# Default number of items identified at once by identify_many
+DEFAULT_CONCURRENCY = 8
+
+
+def _identify(fido, item, extension):
+    """Return the list of Result records of item, see Fido.identify."""
+    return list(fido.identify([item], extension=extension))
+
+
+async def identify_path(fido, item, extension=True, executor=None):
+    """
+    Identify item with fido in executor, return the list of its Result records.
+
+    item is a file name, a file object, a buffer of bytes or a (name, file
+    object or buffer) tuple, as taken by Fido.identify.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, partial(_identify, fido, item, extension))
+
+
+async def identify_many(fido, items, concurrency=DEFAULT_CONCURRENCY, extension=True, executor=None, ordered=True):
+    """
+    Identify each item of items with fido in executor, yield its Result records.
+
+    items is an iterable or an asynchronous iterable of the items taken by
+    identify_path.  No more than concurrency items are identified, or read
+    from items, ahead of those whose results have been yielded.  The results
+    are yielded in the order of items if ordered is True, or as the items
+    complete otherwise.
+    """
+    loop = asyncio.get_event_loop()
+    # Compile the signatures once, rather than in each thread of executor
+    await loop.run_in_executor(executor, fido.prepare_signatures)
+    pending = deque()
+    try:
+        async for item in _aiter(items):
+            if len(pending) >= concurrency:
+                for result in await _next_done(pending, ordered):
+                    yield result
+            pending.append(loop.run_in_executor(executor, partial(_identify, fido, item, extension)))
+        while pending:
+            for result in await _next_done(pending, ordered):
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _aiter(items):
+    """Iterate over items, an iterable or an asynchronous iterable."""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _next_done(pending, ordered):
+    """Remove the first future of pending, or the first one done if not ordered, and return its result."""
+    if ordered:
+        return await pending.popleft()
+    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    future = next(iter(done))
+    pending.remove(future)
+    return future.result()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+FIDO: Format Identifier for Digital Objects.
+
+Copyright 2010 The Open Preservation Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Cache of the compiled signatures of format files.
+
+Analysing the regexes of the signatures of a format file takes most of the
+time FIDO needs to start.  The result is saved to a file of the cache
+directory, named after the format file, a hash of its path and the hash of
+its contents, so that an updated format file is compiled again.  Saving a
+format file only replaces the cache files of the same path, FIDO version and
+Python version.  The regexes themselves are compiled on first use.
+
+A cache file is a database of the format file: MAGIC, the length of the index
+as an 8 byte big-endian unsigned integer, the pickled index, then the XML of
+each <format> element.  The index holds the compiled signatures and, for each
+format, its FormatRecord fields and the offset and length of its XML after
+the index.  The file is read through a read-only memory map, so that the
+processes using it share its pages, and the XML of a format is only decoded
+when a record needs more than it holds.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from xml.etree import ElementTree as ET
+
+from six.moves import cPickle as pickle
+
+from fido import __version__
+from fido.formats import FormatRecord
+
+# Version of the layout of the cached data, part of the hash of the cache files
+CACHE_FORMAT = 5
+
+MAGIC = b'FIDO signatures\n'
+INDEX_LENGTH = struct.Struct('>Q')
+
+
+def default_cache_dir():
+    """Return the directory of the cache of the current user."""
+    if os.name == 'nt' and os.environ.get('LOCALAPPDATA'):
+        return os.path.join(os.environ['LOCALAPPDATA'], 'fido', 'cache')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'fido')
+
+
+class SignatureCache(object):
+    """
+    Cache of the compiled signatures of format files, in directory.
+
+    The signatures of a format file are cached as a dict mapping each puid
+    to a list of (signature name, tuple of Pattern), along with its format
+    elements.  Failures to read or write the cache are ignored, the
+    signatures then being compiled as usual.
+    """
+
+    def __init__(self, directory=None):
+        """Instantiate a cache in directory, default_cache_dir() if None."""
+        self.directory = default_cache_dir() if directory is None else directory
+
+    def digest(self, format_file):
+        """Return the hash of format_file, which changes with its contents."""
+        sha = hashlib.sha256(self.header().encode('utf-8'))
+        with open(format_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def header(self):
+        """Return the text hashed before the contents of a format file, which changes with the versions of FIDO, the cache layout and Python."""
+        return 'fido-{}-{}-py{}\n'.format(__version__, CACHE_FORMAT, sys.version_info[0])
+
+    def prefix(self, format_file):
+        """Return the prefix of the names of the cache files of format_file, which is specific to its path."""
+        source = hashlib.sha256((self.header() + os.path.abspath(format_file)).encode('utf-8')).hexdigest()[:16]
+        return '{}-{}-'.format(os.path.basename(format_file), source)
+
+    def path(self, format_file, digest):
+        """Return the path of the cache file of format_file for its digest."""
+        return os.path.join(self.directory, '{}{}.fidodb'.format(self.prefix(format_file), digest))
+
+    def load(self, format_file, digest):
+        """
+        Return the cached (format records, signatures) of format_file, or None if they are not in the cache.
+
+        The records are in the order of the elements of the format file.
+        """
+        try:
+            database = FormatDatabase(self.path(format_file, digest))
+            index = database.read_index()
+            return database.records(index['formats']), index['signatures']
+        except Exception:
+            return None
+
+    def save(self, format_file, digest, elements, signatures):
+        """Cache the format elements and signatures of format_file, replacing those of its other versions."""
+        path = self.path(format_file, digest)
+        prefix = self.prefix(format_file)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory, 0o700)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix=prefix, suffix='.tmp')
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                write_database(f, elements, signatures)
+            _replace(temp_path, path)
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name.endswith('.fidodb') and name != os.path.basename(path):
+                    os.remove(os.path.join(self.directory, name))
+        except (IOError, OSError, pickle.PicklingError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def _replace(source, target):
+    """Rename source to target, atomically replacing target if it exists."""
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+        return
+    # Python 2: rename replaces atomically, except on Windows where it fails
+    if os.name == 'nt' and os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+
+def write_database(f, elements, signatures):
+    """Write the database of format elements and their signatures to the file object f."""
+    blobs = [ET.tostring(element, encoding='utf-8') for element in elements]
+    formats = []
+    offset = 0
+    for element, blob in zip(elements, blobs):
+        formats.append((FormatRecord.fields(element), offset, len(blob)))
+        offset += len(blob)
+    index = pickle.dumps({'formats': formats, 'signatures': signatures}, pickle.HIGHEST_PROTOCOL)
+    f.write(MAGIC + INDEX_LENGTH.pack(len(index)) + index)
+    for blob in blobs:
+        f.write(blob)
+
+
+class FormatDatabase(object):
+    """A database written by write_database, read through a read-only memory map."""
+
+    def __init__(self, path):
+        """Open the database at path."""
+        self.path = path
+        # Offset of the XML of the formats, known once the index is read
+        self.start = None
+        self.open()
+
+    def open(self):
+        """Map the database."""
+        with open(self.path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_index(self):
+        """Return the index of the database."""
+        index_start = len(MAGIC) + INDEX_LENGTH.size
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a FIDO signature database: {}'.format(self.path))
+        (index_length,) = INDEX_LENGTH.unpack(self.map[len(MAGIC):index_start])
+        self.start = index_start + index_length
+        return pickle.loads(self.map[index_start:self.start])
+
+    def records(self, formats):
+        """Return the FormatRecord of each format of the index."""
+        return [FormatRecord(fields, DatabaseEntry(self, offset, length)) for fields, offset, length in formats]
+
+    def decode(self, offset, length):
+        """Return the format element whose XML is at offset, of length bytes."""
+        start = self.start + offset
+        return ET.fromstring(self.map[start:start + length])
+
+    def __getstate__(self):
+        """Return the state to pickle: the database is mapped again where it is unpickled."""
+        return {'path': self.path, 'start': self.start}
+
+    def __setstate__(self, state):
+        """Restore a pickled database."""
+        self.path = state['path']
+        self.start = state['start']
+        self.open()
+
+
+class DatabaseEntry(object):
+    """The source of a FormatRecord, decoding its element from a FormatDatabase."""
+
+    __slots__ = ('database', 'offset', 'length')
+
+    def __init__(self, database, offset, length):
+        """Instantiate for the element at offset in database, of length bytes."""
+        self.database = database
+        self.offset = offset
+        self.length = length
+
+    def __call__(self):
+        """Return the element."""
+        return self.database.decode(self.offset, self.length)
+
+    def __getstate__(self):
+        """Return the state to pickle."""
+        return (self.database, self.offset, self.length)
+
+    def __setstate__(self, state):
+        """Restore a pickled entry."""
+        self.database, self.offset, self.length = state
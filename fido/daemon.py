@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+FIDO: Format Identifier for Digital Objects.
+
+Copyright 2010 The Open Preservation Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+FIDO daemon, identifying files with signatures loaded once.
+
+`fido -serve SOCKET` answers identification requests on a Unix socket, and
+`fido-client -socket SOCKET FILE...` sends them.  Each message is a frame: its
+length as a 4 byte big-endian unsigned integer, then its bytes.  A request is
+a frame holding a JSON object, either {"path": ...} to identify a file or
+{"name": ...} to identify the bytes of the frame that follows it, with an
+optional "extension" boolean.  The response is a frame holding a JSON
+object, {"output": ...} with the text that fido would print for the file, or
+{"error": ...}.  A connection may carry any number of requests.
+"""
+from __future__ import absolute_import
+
+from argparse import ArgumentParser
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+
+from six.moves import socketserver
+
+from fido.fido import list_files
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+class DaemonError(Exception):
+    """An error returned by the FIDO daemon."""
+
+
+def read_frame(sock):
+    """Read a frame from sock and return its bytes, or None if the connection was closed before it."""
+    header = _read_bytes(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    data = _read_bytes(sock, length)
+    if data is None:
+        raise EOFError("Connection closed in a frame")
+    return data
+
+
+def write_frame(sock, data):
+    """Write data to sock as a frame."""
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+def _read_bytes(sock, size):
+    """Read size bytes from sock, return None if the connection is closed first."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1024 * 1024))
+        if not chunk:
+            if data:
+                raise EOFError("Connection closed in a frame")
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+class IdentificationHandler(socketserver.BaseRequestHandler):
+    """Answer the requests sent on a connection to an IdentificationServer."""
+
+    def handle(self):
+        """Answer each request until the client closes the connection."""
+        while True:
+            header = read_frame(self.request)
+            if header is None:
+                return
+            try:
+                request = json.loads(header.decode('utf-8'))
+                if 'path' in request:
+                    response = self.server.identify_path(request['path'], request.get('extension'))
+                else:
+                    data = read_frame(self.request)
+                    if data is None:
+                        return
+                    response = self.server.identify_bytes(data, request.get('name', ''), request.get('extension'))
+            except (ValueError, TypeError, AttributeError) as excep:
+                response = {'error': 'Bad request: {}'.format(excep)}
+            write_frame(self.request, json.dumps(response).encode('utf-8'))
+
+
+class IdentificationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A server identifying files with a Fido instance, each connection in a thread.
+
+    The server takes over the match handler of the instance.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fido, address, extension=True):
+        """Instantiate a server on the Unix socket at address, matching extensions by default if extension is True."""
+        self.fido = fido
+        self.extension = extension
+        self.local = threading.local()
+        fido.handle_matches = self.handle_matches
+        socketserver.UnixStreamServer.__init__(self, address, IdentificationHandler)
+
+    def handle_matches(self, *args):
+        """Keep the output of the matches for the response to the request of the current thread."""
+        self.local.output.append(self.fido.format_matches(*args))
+
+    def identify_path(self, path, extension=None):
+        """Return the response to a request to identify the file at path."""
+        if not os.path.isfile(path):
+            return {'error': 'No such file: {}'.format(path)}
+        self.local.output = []
+        self.fido.identify_file(path, extension=self.extension if extension is None else extension)
+        return {'output': ''.join(self.local.output)}
+
+    def identify_bytes(self, data, name='', extension=None):
+        """Return the response to a request to identify data, the content of a file named name."""
+        self.local.output = []
+        self.fido.identify_object(data, name, extension=self.extension if extension is None else extension)
+        return {'output': ''.join(self.local.output)}
+
+
+def serve(fido, address, extension=True):
+    """Answer identification requests with fido on the Unix socket at address, until interrupted."""
+    fido.prepare_signatures()
+    # Replace the socket of a daemon that is gone, but no other file
+    if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+        os.unlink(address)
+    server = IdentificationServer(fido, address, extension)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(address)
+
+
+class Client(object):
+    """A connection to a FIDO daemon."""
+
+    def __init__(self, address):
+        """Connect to the daemon listening on the Unix socket at address."""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(address)
+
+    def close(self):
+        """Close the connection."""
+        self.sock.close()
+
+    def identify_path(self, path, extension=None):
+        """Return the output of the daemon for the file at path, which must be a path it can open."""
+        return self._request({'path': os.path.abspath(path), 'extension': extension})
+
+    def identify_bytes(self, data, name='', extension=None):
+        """Return the output of the daemon for data, the content of a file named name."""
+        return self._request({'name': name, 'extension': extension}, data)
+
+    def _request(self, request, data=None):
+        write_frame(self.sock, json.dumps(request).encode('utf-8'))
+        if data is not None:
+            write_frame(self.sock, data)
+        frame = read_frame(self.sock)
+        if frame is None:
+            raise DaemonError("Connection closed by the daemon")
+        response = json.loads(frame.decode('utf-8'))
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return response['output']
+
+
+def main(args=None):
+    """Identify files with a FIDO daemon."""
+    if args is None:
+        args = sys.argv[1:]
+
+    parser = ArgumentParser(description='Identify files with a FIDO daemon started with fido -serve SOCKET.')
+    parser.add_argument('-socket', required=True, help='Unix socket of the daemon')
+    parser.add_argument('-recurse', default=False, action='store_true', help='recurse into subdirectories')
+    parser.add_argument('-noextension', default=False, action='store_true', help='disable extension matching, reduces number of matches but may reduce false positives')
+    parser.add_argument('-filename', default=None, help='filename if file contents passed through STDIN')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-input', default=False, help='file containing a list of files to check, one per line. - means stdin')
+    group.add_argument('files', nargs='*', default=[], metavar='FILE', help='files to check. If the file is -, then send content from stdin.')
+    args = parser.parse_args(args)
+
+    extension = False if args.noextension else None
+    if args.input == '-':
+        files = sys.stdin
+    elif args.input:
+        files = open(args.input, 'r')
+    else:
+        files = args.files
+
+    client = Client(args.socket)
+    try:
+        if not args.input and args.files == ['-']:
+            stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+            sys.stdout.write(client.identify_bytes(stdin.read(), args.filename or '', extension))
+            return
+        for filename in list_files(files, args.recurse):
+            try:
+                sys.stdout.write(client.identify_path(filename, extension))
+            except DaemonError as excep:
+                sys.stderr.write("FIDO: {}\n".format(excep))
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
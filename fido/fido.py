@@ -11,13 +11,20 @@ It is designed for simple integration into automated work-flows.
 from __future__ import absolute_import
 
 from argparse import ArgumentParser, RawTextHelpFormatter
+from collections import deque, namedtuple
 from contextlib import closing
+from functools import partial
+import io
+import mmap
+import multiprocessing
 import os
 import platform
 import re
+import signal
 import sys
 import tarfile
 import tempfile
+import threading
 try:
     from time import perf_counter
 except ImportError:
@@ -26,18 +33,20 @@ except ImportError:
 from xml.etree import cElementTree as ET
 import zipfile
 
-from six import PY2
-from six.moves import range
+from six import PY2, reraise, string_types
+from six.moves import queue, range
 
 from fido import __version__, CONFIG_DIR
-from fido.package import OlePackage, ZipPackage
+from fido.package import OlePackage, signature_overlap, ZipPackage
+from fido.cache import SignatureCache
+from fido.formats import FileEntry, FormatFile, FormatRecord
+from fido.signatures import compile_signatures, DeferredBuffer, RegexCache, Signature, SignatureEngine
 from fido.versions import get_local_versions, sig_file_actions
 from fido.char_handler import escape
 
 
 defaults = {
     'bufsize': 128 * 1024,  # (bytes)
-    'regexcachesize': 2084,  # (bytes)
     'printmatch': "OK,%(info.time)s,%(info.puid)s,\"%(info.formatname)s\",\"%(info.signaturename)s\",%(info.filesize)s,\"%(info.filename)s\",\"%(info.mimetype)s\",\"%(info.matchtype)s\"\n",
     'printnomatch': "KO,%(info.time)s,,,,%(info.filesize)s,\"%(info.filename)s\",,\"%(info.matchtype)s\"\n",
     'format_files': [
@@ -78,11 +87,40 @@ class PerfTimer:
         return perf_counter() - self.start_time
 
 
-class Fido:
-    """Main FIDO application class."""
+# A match yielded by Fido.identify.  puid, formatname and signaturename are
+# None if the file did not match (matchtype "fail"), time is in seconds.
+Result = namedtuple('Result', ['filename', 'puid', 'formatname', 'signaturename', 'matchtype', 'filesize', 'time'])
 
-    def __init__(self, quiet=False, bufsize=None, container_bufsize=None, printnomatch=None, printmatch=None, zip=False, nocontainer=False, handle_matches=None, conf_dir=CONFIG_DIR, format_files=None, containersignature_file=None):
-        """Initialise a FIDO class instance."""
+
+class IdentificationContext(object):
+    """The state of the identification of a file or stream, see Fido.context."""
+
+    def __init__(self, filename='', filesize=0, matchtype=None):
+        """Instantiate the context of the identification of filename."""
+        self.filename = filename
+        self.filesize = filesize
+        self.matchtype = matchtype
+
+
+class Fido(object):
+    """
+    Main FIDO application class.
+
+    A single instance may identify files in several threads at once; the state
+    of each identification is kept in an IdentificationContext of its thread.
+    """
+
+    def __init__(self, quiet=False, bufsize=None, container_bufsize=None, printnomatch=None, printmatch=None, zip=False, nocontainer=False, handle_matches=None, conf_dir=CONFIG_DIR, format_files=None, containersignature_file=None, lazy_eof=False, read_step=None, signature_cache=True, use_mmap=False, var_scan=False):
+        """
+        Initialise a FIDO class instance.
+
+        signature_cache is the SignatureCache of the compiled signatures of
+        the format files, True for the default one or False for none.
+        If use_mmap is True, identify_file matches the signatures against a
+        memory map of each file, see match_mapped_file.
+        If var_scan is True, the VAR patterns not found in the beginning of a
+        seekable file are searched for through the rest of it, see scan_stream.
+        """
         global defaults
         self.quiet = quiet
         self.bufsize = defaults['bufsize'] if bufsize is None else bufsize
@@ -92,24 +130,93 @@ class Fido:
         self.handle_matches = self.print_matches if handle_matches is None else handle_matches
         self.zip = zip
         self.nocontainer = nocontainer
+        self.lazy_eof = lazy_eof
+        self.read_step = read_step
+        self.use_mmap = use_mmap
+        self.var_scan = var_scan
         self.conf_dir = conf_dir
         self.format_files = defaults['format_files'] if format_files is None else format_files
         self.containersignature_file = defaults['containersignature_file']
+        self.container_signature_map = None
         self.formats = []
         self.puid_format_map = {}
         self.puid_has_priority_over_map = {}
+        self.puid_signature_map = {}
+        self.signature_engine = None
+        # Compiled regexes of the format and container signatures
+        self.regex_cache = RegexCache()
+        self.signature_cache = SignatureCache() if signature_cache is True else signature_cache
         # load signatures
         for xml_file in self.format_files:
             self.load_fido_xml(os.path.join(os.path.abspath(self.conf_dir), xml_file))
-        self.current_file = ''
-        self.current_filesize = 0
-        self.current_format = None
-        self.current_sig = None
-        self.current_pat = None
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
         self.current_count = 0  # Count of calls to match_formats
-        re._MAXCACHE = defaults['regexcachesize']
         self.externalsig = ET.XML('<signature><name>External</name></signature>')
 
+    def __getstate__(self):
+        """Return the state of the instance to pickle, without its per-thread state."""
+        state = self.__dict__.copy()
+        del state['_local']
+        del state['_count_lock']
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled instance."""
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
+        # The patterns lose their regex cache when pickled
+        self.use_regex_cache(sig for signatures in self.puid_signature_map.values() for sig in signatures)
+
+    def use_regex_cache(self, signatures):
+        """Compile the regexes of the restored patterns of signatures through self.regex_cache."""
+        for sig in signatures:
+            for pattern in sig.patterns:
+                pattern.use_cache(self.regex_cache)
+
+    @property
+    def context(self):
+        """The IdentificationContext of the current thread."""
+        context = getattr(self._local, 'context', None)
+        if context is None:
+            context = self.new_context()
+        return context
+
+    def new_context(self, filename='', filesize=0, matchtype=None):
+        """Start the identification of filename in the current thread, return its IdentificationContext."""
+        context = self._local.context = IdentificationContext(filename, filesize, matchtype)
+        return context
+
+    # The attributes below are kept for compatibility, they are those of self.context
+
+    @property
+    def current_file(self):
+        """The name of the file being identified in the current thread."""
+        return self.context.filename
+
+    @current_file.setter
+    def current_file(self, value):
+        self.context.filename = value
+
+    @property
+    def current_filesize(self):
+        """The size of the file being identified in the current thread."""
+        return self.context.filesize
+
+    @current_filesize.setter
+    def current_filesize(self, value):
+        self.context.filesize = value
+
+    @property
+    def matchtype(self):
+        """The type of match looked for in the current thread."""
+        return self.context.matchtype
+
+    @matchtype.setter
+    def matchtype(self, value):
+        self.context.matchtype = value
+
     def convert_container_sequence(self, sig):
         """Parse the PRONOM container sequences and convert to regular expressions."""
         # The sequence is regex matching bytes from a file so the sequence must also be bytes
@@ -182,16 +289,19 @@ class Fido:
         }
         """
         root = doc.getroot()
-        format_mappings = root.find("FileFormatMappings")
+        puids = dict((mapping.attrib["signatureId"], mapping.attrib["Puid"]) for mapping in root.findall("FileFormatMappings/FileFormatMapping"))
 
         def get_puid(doc, element_id):
-            return format_mappings.find('FileFormatMapping[@signatureId="{}"]'.format(element_id)).attrib["Puid"]
+            return puids[element_id]
 
         def format_signature_attributes(element):
+            signature = self.convert_container_sequence(element.findtext("Files/File/BinarySignatures/InternalSignatureCollection/InternalSignature/ByteSequence/SubSequence/Sequence"))
             return {
                 "path": element.findtext("Files/File/Path"),
                 "id": element.attrib["Id"],
-                "signature": self.convert_container_sequence(element.findtext("Files/File/BinarySignatures/InternalSignatureCollection/InternalSignature/ByteSequence/SubSequence/Sequence"))
+                "signature": signature,
+                "regex": self.regex_cache.compile(signature),
+                "overlap": signature_overlap(signature)
             }
 
         elements = root.findall("ContainerSignatures/ContainerSignature[@ContainerType=\"{}\"]".format(signature_type))
@@ -201,18 +311,42 @@ class Fido:
                 continue
 
             puid = get_puid(doc, el.attrib["Id"])
-            signature = format_signature_attributes(el)
+            try:
+                signature = format_signature_attributes(el)
+            except re.error as compile_excep:
+                sys.stderr.write('FIDO: Skipping container signature "{}" of {}: {}\n'.format(el.attrib["Id"], puid, compile_excep))
+                continue
             path = signature["path"]
             if path not in signatures:
                 signatures[path] = {}
             if puid not in signatures[path]:
                 signatures[path][puid] = []
-            signatures[path][puid].append(format_signature_attributes(el))
+            signatures[path][puid].append(signature)
         return signatures
 
-    def match_container(self, signature_type, klass, file, signature_file):
-        """Return the signature matches for a container."""
-        puids = klass(file, self.extract_signatures(signature_file, signature_type=signature_type)).detect_formats()
+    def get_container_signatures(self, signature_type):
+        """
+        Return the signatures of signature_type from the container signature file, as returned by extract_signatures.
+
+        The container signature file is only parsed on first use.
+        """
+        if self.container_signature_map is None:
+            doc = ET.parse(os.path.join(os.path.abspath(self.conf_dir), self.containersignature_file))
+            self.container_signature_map = dict((container_type, self.extract_signatures(doc, signature_type=container_type)) for container_type in ("ZIP", "OLE2"))
+        return self.container_signature_map[signature_type]
+
+    def match_container(self, signature_type, klass, file, signature_file=None):
+        """
+        Return the signature matches for a container.
+
+        The signatures are read from the parsed XML document signature_file if
+        given, otherwise from the container signature file of this instance.
+        """
+        if signature_file is None:
+            signatures = self.get_container_signatures(signature_type)
+        else:
+            signatures = self.extract_signatures(signature_file, signature_type=signature_type)
+        puids = klass(file, signatures, self.regex_cache, self.container_bufsize).detect_formats()
         results = []
         for puid in puids:
             format = self.puid_format_map[puid]
@@ -225,19 +359,43 @@ class Fido:
         Load the fido format information from @param file.
 
         As a side-effect, set self.formats.
-        @return list of ElementTree.Element, one for each format.
+        If the formats of file are in the signature cache, they are loaded
+        from there as FormatRecord, rather than parsed from file.
+        @return list of ElementTree.Element or FormatRecord, one for each format.
         """
         try:
+            digest = None
+            if self.signature_cache:
+                digest = self.signature_cache.digest(file)
+                cached = self.signature_cache.load(file, digest)
+                if cached is not None:
+                    records, signatures = cached
+                    for record in records:
+                        self.process_format_element(record, signatures.get(record.puid))
+                    return self.formats
             tree = ET.parse(file)
-            for element in tree.getroot().findall('./format'):
-                self.process_format_element(element)
+            elements = tree.getroot().findall('./format')
+            format_file = FormatFile(file)
+            signatures = {}
+            for index, element in enumerate(elements):
+                # Only keep a record of the element, its signatures being compiled now
+                record = FormatRecord(FormatRecord.fields(element), FileEntry(format_file, index))
+                signatures[record.puid] = [(sig.name, sig.patterns) for sig in compile_signatures(element, record.puid, self.regex_cache)]
+                self.process_format_element(record, signatures[record.puid])
+            if digest is not None:
+                self.signature_cache.save(file, digest, elements, signatures)
         except ET.ParseError as parse_excep:
             sys.stderr.write('Failed to parse signature file {}, exception: {}\n'.format(file, parse_excep))
             sys.exit(1)
         return self.formats
 
-    def process_format_element(self, element):
-        """Process an individual sig file XML element."""
+    def process_format_element(self, element, signatures=None):
+        """
+        Process an individual sig file XML element.
+
+        @param signatures is the list of (name, patterns) of the signatures of
+        the element taken from the signature cache, if any.
+        """
         # TODO: Handle empty regexes properly; perhaps remove from the format list
         puid = self.get_puid(element)
         # Handle over-writes in multiple file loads
@@ -250,8 +408,27 @@ class Fido:
         self.puid_format_map[puid] = element
         # Build some structures to speed things up
         self.puid_has_priority_over_map[puid] = frozenset([puid_element.text for puid_element in element.findall('has_priority_over')])
-
-    # To delete a format: (1) remove from self.formats, (2) remove from puid_format_map, (3) remove from selt.puid_has_priority_over_map
+        if signatures is None:
+            self.puid_signature_map[puid] = compile_signatures(element, puid, self.regex_cache)
+        else:
+            self.puid_signature_map[puid] = tuple(Signature(element, puid, name, patterns) for name, patterns in signatures)
+            self.use_regex_cache(self.puid_signature_map[puid])
+        self.signature_engine = None
+
+    def get_signature_engine(self):
+        """Return the compiled signatures of self.formats, rebuilding them if the format list has changed."""
+        if self.signature_engine is None or self.signature_engine.formats is not self.formats:
+            self.signature_engine = SignatureEngine(self.formats, self.puid_signature_map, self.get_puid,
+                                                    self.puid_has_priority_over_map, self.get_extensions)
+        return self.signature_engine
+
+    def prepare_signatures(self):
+        """Compile the signatures now rather than on first use, before identifying files in several threads or processes."""
+        self.get_signature_engine()
+        if not self.nocontainer:
+            self.get_container_signatures("ZIP")
+
+    # To delete a format: (1) remove from self.formats, (2) remove from puid_format_map, (3) remove from selt.puid_has_priority_over_map, (4) remove from puid_signature_map
     def get_signatures(self, format):
         """Return the signatures for the format element."""
         return format.findall('signature')
@@ -264,6 +441,12 @@ class Fido:
         """Return the PUID for the format."""
         return format.find('puid').text
 
+    def get_extensions(self, format):
+        """Return the extensions of the format."""
+        if isinstance(format, FormatRecord):
+            return format.extensions
+        return [extension.text for extension in format.findall('extension')]
+
     def get_patterns(self, signature):
         """Return the patterns for a signature."""
         return signature.findall('pattern')
@@ -285,6 +468,33 @@ class Fido:
         """
         The default match handler. Prints out information for each match in the list.
 
+        See format_matches for the parameters.
+        """
+        sys.stdout.write(self.format_matches(fullname, matches, delta_t, matchtype))
+
+    def report_matches(self, fullname, matches, delta_t, matchtype=''):
+        """Pass the matches to self.handle_matches, or to the results of Fido.identify if it runs in the current thread."""
+        results = getattr(self._local, 'results', None)
+        if results is None:
+            self.handle_matches(fullname, matches, delta_t, matchtype)
+        else:
+            results.extend(self.make_results(fullname, matches, delta_t, matchtype))
+
+    def make_results(self, fullname, matches, delta_t, matchtype=''):
+        """
+        Return the list of Result records of a list of matches.
+
+        See format_matches for the parameters.
+        """
+        filesize = self.context.filesize
+        if len(matches) == 0:
+            return [Result(fullname, None, None, None, "fail", filesize, delta_t)]
+        return [Result(fullname, self.get_puid(f), f.findtext('name'), sig_name, matchtype, filesize, delta_t) for (f, sig_name) in matches]
+
+    def format_matches(self, fullname, matches, delta_t, matchtype=''):
+        """
+        Return the output of print_matches for a list of matches.
+
         @param fullname is name of the file being matched
         @param matches is a list of (format, signature)
         @param delta_t is the time taken for the match.
@@ -297,17 +507,17 @@ class Fido:
         obj.group_size = len(matches)
         obj.filename = fullname
         obj.time = int(delta_t * 1000)
-        obj.filesize = self.current_filesize
+        obj.filesize = self.context.filesize
         obj.matchtype = matchtype
         if len(matches) == 0:
-            sys.stdout.write(self.printnomatch % {
+            return self.printnomatch % {
                 "info.time": obj.time,
                 "info.filesize": obj.filesize,
                 "info.filename": obj.filename,
                 "info.count": obj.count,
                 "info.matchtype": "fail"
-            })
-            return
+            }
+        output = []
         i = 0
         for (f, sig_name) in matches:
             i += 1
@@ -321,9 +531,9 @@ class Fido:
             obj.version = version.text if version is not None else None
             alias = f.find('alias')
             obj.alias = alias.text if alias is not None else None
-            apple_uti = f.find('apple_uid')
+            apple_uti = f.find('apple_uti')
             obj.apple_uti = apple_uti.text if apple_uti is not None else None
-            sys.stdout.write(self.printmatch % {
+            output.append(self.printmatch % {
                 "info.time": obj.time,
                 "info.puid": obj.puid,
                 "info.formatname": obj.formatname,
@@ -339,6 +549,7 @@ class Fido:
                 "info.group_index": obj.group_index,
                 "info.count": obj.count
             })
+        return ''.join(output)
 
     def print_summary(self, secs):
         """Print summary information on the number of matches and time taken."""
@@ -348,53 +559,236 @@ class Fido:
             # print >> sys.stderr, 'FIDO: Processed %6d files in %6.2f msec, %2d files/sec' %  (count, secs * 1000, rate)
             sys.stderr.write('FIDO: Processed %6d files in %6.2f msec, %2d files/sec\n' % (count, secs * 1000, rate))
 
-    def identify_file(self, filename, extension=True):
+    def identify_file(self, filename, extension=True, prefetched=None):
         """
         Identify the type of @param filename.
 
+        @param prefetched is a PrefetchedFile holding the buffers of filename,
+        if they have been read already.
         Call self.handle_matches instead of returning a value.
         """
-        self.current_file = filename
-        self.matchtype = "signature"
+        context = self.new_context(filename, matchtype="signature")
         try:
             timer = PerfTimer()
-            f = open(filename, 'rb')
-            size = os.stat(filename)[6]
-            self.current_filesize = size
-            if self.current_filesize == 0:
-                sys.stderr.write("FIDO: Zero byte file (empty): Path is: " + filename + "\n")
-            bofbuffer, eofbuffer, _ = self.get_buffers(f, size, seekable=True)
-            matches = self.match_formats(bofbuffer, eofbuffer)
-            container_type = self.container_type(matches)
-            if not self.nocontainer and container_type in ("zip", "ole"):
-                container_file = ET.parse(os.path.join(os.path.abspath(self.conf_dir), self.containersignature_file))
-                if container_type == "zip":
-                    container_matches = self.match_container("ZIP", ZipPackage, filename, container_file)
-                else:
-                    container_matches = self.match_container("OLE2", OlePackage, filename, container_file)
-                if len(container_matches) > 0:
-                    self.handle_matches(filename, container_matches, timer.duration(), "container")
-                    return
-            # from here is also repeated in walk_zip
-            # we should make this uniform in a next version!
-            #
-            # filesize is made conditional because files with 0 bytes
-            # are falsely characterised being 'rtf' (due to wacky sig)
-            # in these cases we try to match the extension instead
-            if len(matches) > 0 and self.current_filesize > 0:
-                self.handle_matches(filename, matches, timer.duration(), self.matchtype)
-            elif extension and (len(matches) == 0 or self.current_filesize == 0):
-                matches = self.match_extensions(filename)
-                self.handle_matches(filename, matches, timer.duration(), "extension")
-            # only recurse into certain containers, like ZIP or TAR
-            container = self.container_type(matches)
-            # till here matey!
-            if self.zip and self.can_recurse_into_container(container):
-                self.identify_contents(filename, type=container, extension=extension)
+            if prefetched is None:
+                # Unbuffered, the buffers being read straight from the file
+                with open(filename, 'rb', 0) as f:
+                    size = os.fstat(f.fileno()).st_size
+                    context.filesize = size
+                    if context.filesize == 0:
+                        sys.stderr.write("FIDO: Zero byte file (empty): Path is: " + filename + "\n")
+                    if self.use_mmap and size > 0:
+                        matches = self.match_mapped_file(f)
+                    else:
+                        matches = self.match_stream(f, size, seekable=True)
+            else:
+                size, bofbuffer, eofbuffer = prefetched.result()
+                context.filesize = size
+                if context.filesize == 0:
+                    sys.stderr.write("FIDO: Zero byte file (empty): Path is: " + filename + "\n")
+                scan = partial(self.scan_file, filename, size, len(bofbuffer)) if self.var_scan and size > len(bofbuffer) else None
+                matches = self.match_formats(bofbuffer, eofbuffer, scan=scan)
+            self.handle_file_matches(filename, matches, timer, extension)
         except IOError as io_excep:
             # print >> sys.stderr, "FIDO: Error in identify_file: Path is {0}".format(filename)
             sys.stderr.write("FIDO: Error in identify_file: {}, exception: {}\n".format(filename, io_excep))
 
+    def handle_file_matches(self, filename, matches, timer, extension=True, fileobj=None):
+        """
+        Report the signature matches of a file, after looking inside it if it is a container.
+
+        @param fileobj is the seekable file object holding the file, if it
+        is not to be opened from filename.
+        """
+        context = self.context
+        container_type = self.container_type(matches)
+        if not self.nocontainer and container_type in ("zip", "ole"):
+            if fileobj is not None:
+                fileobj.seek(0)
+            if container_type == "zip":
+                container_matches = self.match_container("ZIP", ZipPackage, filename if fileobj is None else fileobj)
+            else:
+                container_matches = self.match_container("OLE2", OlePackage, filename if fileobj is None else fileobj)
+            if len(container_matches) > 0:
+                self.report_matches(filename, container_matches, timer.duration(), "container")
+                return
+        # from here is also repeated in walk_zip
+        # we should make this uniform in a next version!
+        #
+        # filesize is made conditional because files with 0 bytes
+        # are falsely characterised being 'rtf' (due to wacky sig)
+        # in these cases we try to match the extension instead
+        if len(matches) > 0 and context.filesize > 0:
+            self.report_matches(filename, matches, timer.duration(), context.matchtype)
+        elif extension and (len(matches) == 0 or context.filesize == 0):
+            matches = self.match_extensions(filename)
+            self.report_matches(filename, matches, timer.duration(), "extension")
+        # only recurse into certain containers, like ZIP or TAR
+        container = self.container_type(matches)
+        # till here matey!
+        if self.zip and self.can_recurse_into_container(container):
+            if fileobj is not None:
+                fileobj.seek(0)
+            self.identify_contents(filename, fileobj, type=container, extension=extension)
+
+    def identify(self, items, extension=True):
+        """
+        Identify each item of the iterable items, yield a Result for each match.
+
+        An item is the name of a file, a file object, a buffer of bytes, or a
+        (name, file object or buffer) tuple.  The name of a file object is
+        that of its name attribute, if any; it is used to match extensions.
+        A seekable file object is identified from its beginning, any other
+        from its current position.  If extension is True, an item that does
+        not match yields a single Result whose matchtype is "fail", otherwise
+        it yields nothing.
+        The results are not passed to self.handle_matches.
+        """
+        for item in items:
+            if isinstance(item, tuple):
+                filename, obj = item
+            elif isinstance(item, string_types):
+                filename, obj = item, None
+            else:
+                filename, obj = getattr(item, 'name', ''), item
+            results = self._local.results = []
+            try:
+                if obj is None:
+                    self.identify_file(filename, extension=extension)
+                else:
+                    self.identify_object(obj, filename, extension=extension)
+            finally:
+                self._local.results = None
+            for result in results:
+                yield result
+
+    def identify_object(self, obj, filename='', extension=True):
+        """
+        Identify the type of @param obj, a file object or a buffer of bytes named filename.
+
+        A seekable file object is identified from its beginning, and looked
+        inside if it is a container.  Does not close obj.
+        Call self.handle_matches instead of returning a value.
+        """
+        if not hasattr(obj, 'read'):
+            obj = io.BytesIO(obj)
+        context = self.new_context(filename, matchtype="signature")
+        timer = PerfTimer()
+        try:
+            obj.seek(0, 2)
+            size = obj.tell()
+            obj.seek(0)
+        except (AttributeError, IOError, OSError, ValueError):
+            # Not seekable
+            bofbuffer, eofbuffer, context.filesize = self.get_buffers(obj, length=None)
+            matches = self.match_formats(bofbuffer, eofbuffer)
+            if len(matches) > 0 and context.filesize > 0:
+                self.report_matches(filename, matches, timer.duration(), context.matchtype)
+            elif extension and (len(matches) == 0 or context.filesize == 0):
+                self.report_matches(filename, self.match_extensions(filename), timer.duration(), "extension")
+            return
+        context.filesize = size
+        if context.filesize == 0:
+            sys.stderr.write("FIDO: Zero byte file (empty): Path is: " + filename + "\n")
+        matches = self.match_stream(obj, size, seekable=True)
+        self.handle_file_matches(filename, matches, timer, extension, obj)
+
+    def identify_files(self, filenames, extension=True, workers=None, ordered=True, prefetch=None):
+        """
+        Identify each file of the iterable filenames.
+
+        If workers is more than one, the files are identified by a pool of that
+        many processes, which inherit the loaded signatures.  Their matches are
+        then passed to self.handle_matches in this process, in the order of
+        filenames if ordered is True or as the files complete otherwise; the
+        output of the default handler is formatted by the workers.
+        Otherwise, if prefetch is set, that many reader threads read the
+        buffers of the next files while the current one is matched.
+        """
+        if not workers or workers < 2:
+            if prefetch:
+                self.identify_prefetched_files(filenames, prefetch, extension)
+                return
+            for filename in filenames:
+                self.identify_file(filename, extension=extension)
+            return
+        # Compile everything now, so that the workers do not each do it
+        self.prepare_signatures()
+        pool = multiprocessing.Pool(workers, _init_worker, (self,))
+        # Only the matches are sent back for a handler other than print_matches
+        forward = self.handle_matches != self.print_matches
+        try:
+            jobs = ((filename, extension, forward) for filename in filenames)
+            imap = pool.imap if ordered else pool.imap_unordered
+            for output, count in imap(_identify_in_worker, jobs, WORKER_CHUNKSIZE):
+                with self._count_lock:
+                    self.current_count += count
+                if forward:
+                    for args in output:
+                        self.handle_worker_matches(*args)
+                else:
+                    sys.stdout.write(output)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def handle_worker_matches(self, fullname, matches, delta_t, matchtype, filesize):
+        """
+        Pass the matches of a file identified by a worker process of identify_files to self.handle_matches.
+
+        @param matches is a list of (puid, signature) of the formats of this instance.
+        @param filesize is the size of the file.
+        """
+        self.new_context(fullname, filesize, matchtype)
+        self.handle_matches(fullname, [(self.puid_format_map[puid], sig_name) for puid, sig_name in matches], delta_t, matchtype)
+
+    def identify_prefetched_files(self, filenames, prefetch, extension=True):
+        """
+        Identify each file of the iterable filenames, reading ahead in prefetch threads.
+
+        Each thread reads the buffers of one file at a time, so up to prefetch
+        files are read ahead of the one being matched.  The buffers are read
+        in full, whether or not self.lazy_eof or self.read_step are set.
+        """
+        pending = queue.Queue()
+
+        def read_files():
+            while True:
+                prefetched = pending.get()
+                if prefetched is None:
+                    return
+                prefetched.read()
+
+        readers = [threading.Thread(target=read_files) for _ in range(prefetch)]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+        ahead = deque()
+        try:
+            for filename in filenames:
+                prefetched = PrefetchedFile(self, filename)
+                pending.put(prefetched)
+                ahead.append(prefetched)
+                if len(ahead) > prefetch:
+                    prefetched = ahead.popleft()
+                    self.identify_file(prefetched.filename, extension=extension, prefetched=prefetched)
+            while ahead:
+                prefetched = ahead.popleft()
+                self.identify_file(prefetched.filename, extension=extension, prefetched=prefetched)
+        finally:
+            for reader in readers:
+                pending.put(None)
+
+    def read_buffers(self, filename):
+        """Return the size, BOF and EOF buffers of filename, read in full."""
+        with open(filename, 'rb', 0) as f:
+            size = os.stat(filename)[6]
+            bofbuffer = self.blocking_read(f, min(size, self.get_read_sizes()[0]), 0)
+            return size, bofbuffer, self.get_eof_buffer(f, size, bofbuffer, seekable=True)
+
     def identify_contents(self, filename, fileobj=None, type=False, extension=True):
         """
         Identify each item in a container (such as a zip or tar file).
@@ -446,16 +840,15 @@ class Fido:
             if content_length == -1:
                 return
             # Consume exactly content-length bytes
-            self.current_file = 'STDIN!(at ' + str(offset) + ' bytes)'
-            self.current_filesize = content_length
+            context = self.new_context('STDIN!(at ' + str(offset) + ' bytes)', content_length)
             bofbuffer, eofbuffer, _ = self.get_buffers(stream, content_length)
             matches = self.match_formats(bofbuffer, eofbuffer)
             # MdR: this needs attention
             if len(matches) > 0:
-                self.handle_matches(self.current_file, matches, timer.duration(), "signature")
-            elif extension and (len(matches) == 0 or self.current_filesize == 0):
-                matches = self.match_extensions(self.current_file)
-                self.handle_matches(self.current_file, matches, timer.duration(), "extension")
+                self.report_matches(context.filename, matches, timer.duration(), "signature")
+            elif extension and (len(matches) == 0 or context.filesize == 0):
+                matches = self.match_extensions(context.filename)
+                self.report_matches(context.filename, matches, timer.duration(), "extension")
 
     def identify_stream(self, stream, filename, extension=True):
         """
@@ -466,31 +859,30 @@ class Fido:
         """
         timer = PerfTimer()
         bofbuffer, eofbuffer, bytes_read = self.get_buffers(stream, length=None)
-        self.current_filesize = bytes_read
-        self.current_file = 'STDIN'
+        context = self.new_context('STDIN', bytes_read)
         matches = self.match_formats(bofbuffer, eofbuffer)
         # MdR: this needs attention
         if len(matches) > 0:
-            self.handle_matches(self.current_file, matches, timer.duration(), "signature")
-        elif extension and (len(matches) == 0 or self.current_filesize == 0):
+            self.report_matches(context.filename, matches, timer.duration(), "signature")
+        elif extension and (len(matches) == 0 or context.filesize == 0):
             # we can only determine the filename from the STDIN stream
             # on Linux, on Windows there is not a (simple) way to do that
             if os.name != "nt":
                 try:
-                    self.current_file = os.readlink("/proc/self/fd/0")
+                    context.filename = os.readlink("/proc/self/fd/0")
                 except OSError:
                     if filename is not None:
-                        self.current_file = filename
+                        context.filename = filename
                     else:
-                        self.current_file = 'STDIN'
+                        context.filename = 'STDIN'
             else:
                 if filename is not None:
-                    self.current_file = filename
-            matches = self.match_extensions(self.current_file)
-            # we have to reset self.current_file if not on Windows
+                    context.filename = filename
+            matches = self.match_extensions(context.filename)
+            # we have to reset context.filename if not on Windows
             if os.name != "nt":
-                self.current_file = 'STDIN'
-            self.handle_matches(self.current_file, matches, timer.duration(), "extension")
+                context.filename = 'STDIN'
+            self.report_matches(context.filename, matches, timer.duration(), "extension")
 
     def container_type(self, matches):
         """
@@ -526,18 +918,66 @@ class Fido:
         """
         return container_type in ('zip', 'tar')
 
-    def blocking_read(self, file, bytes_to_read):
-        """Perform a blocking read and return the buffer."""
+    def blocking_read(self, file, bytes_to_read, offset=None):
+        """
+        Perform a blocking read and return the buffer, a bytearray.
+
+        The buffer holds fewer than bytes_to_read bytes if the end of file is
+        reached first.  If offset is not None, file is seekable and is read
+        from that offset, see read_into.
+        """
+        buffer = bytearray(bytes_to_read)
+        bytes_read = self.read_into(file, memoryview(buffer), offset)
+        if bytes_read < bytes_to_read:
+            buffer = buffer[:bytes_read]
+        return buffer
+
+    def read_into(self, stream, view, offset=None):
+        """
+        Read from stream into the writable memoryview view until it is full or the stream ends.
+
+        If offset is not None, the stream is seekable and is read from that
+        offset; a file is then read with os.preadv, without moving its position.
+        @return the number of bytes read.
+        """
+        size = len(view)
         bytes_read = 0
-        buffer = b''
-        while bytes_read < bytes_to_read:
-            readbuffer = file.read(bytes_to_read - bytes_read)
-            buffer += readbuffer
-            bytes_read = len(buffer)
+        fd = None if offset is None else _file_descriptor(stream)
+        if offset is not None and fd is None:
+            stream.seek(offset)
+        readinto = getattr(stream, 'readinto', None)
+        while bytes_read < size:
+            if fd is not None:
+                count = os.preadv(fd, [view[bytes_read:]], offset + bytes_read)
+            elif readinto is not None:
+                count = readinto(view[bytes_read:])
+            else:
+                chunk = stream.read(size - bytes_read)
+                count = len(chunk)
+                view[bytes_read:bytes_read + count] = chunk
             # break out if EOF is reached.
-            if readbuffer == '':
+            if not count:
                 break
-        return buffer
+            bytes_read += count
+        return bytes_read
+
+    def skip(self, stream, bytes_to_skip):
+        """Read and discard bytes_to_skip bytes of a stream that cannot seek, return the number of bytes skipped."""
+        scratch = memoryview(self.scratch_buffers()[0])
+        skipped = 0
+        while skipped < bytes_to_skip:
+            count = self.read_into(stream, scratch[:min(bytes_to_skip - skipped, len(scratch))])
+            if not count:
+                break
+            skipped += count
+        return skipped
+
+    def scratch_buffers(self):
+        """Return two bytearrays of self.bufsize bytes, reused by the reads of the current thread."""
+        buffers = getattr(self._local, 'scratch', None)
+        if buffers is None or len(buffers[0]) != self.bufsize:
+            buffers = self._local.scratch = (bytearray(self.bufsize), bytearray(self.bufsize))
+        return buffers
 
     def get_buffers(self, stream, length=None, seekable=False):
         """
@@ -547,46 +987,81 @@ class Fido:
 
         If length is None, return the length as found.
         If seekable is False, the steam does not support a seek operation.
+        If length is known, the buffers hold no more bytes than the loaded
+        signatures can look at.
+        If self.lazy_eof is set and the stream is seekable, the buffer from the
+        end of the stream is a DeferredBuffer that is only read when needed.
+        If self.read_step is set and the stream is seekable, the buffer from the
+        beginning of the stream only holds its first self.read_step bytes.
+        A seekable stream is read from its beginning, otherwise from its
+        current position.  The buffers are bytearrays.
         """
-        bytes_to_read = self.bufsize if length is None else min(length, self.bufsize)
-        bofbuffer = self.blocking_read(stream, bytes_to_read)
+        bytes_to_read = self.bufsize if length is None else min(length, self.get_read_sizes()[0])
+        offset = 0 if seekable else None
+        if length is not None and self.read_step and seekable:
+            bofbuffer = self.blocking_read(stream, min(bytes_to_read, self.read_step), offset)
+        else:
+            bofbuffer = self.blocking_read(stream, bytes_to_read, offset)
         bytes_read = len(bofbuffer)
         if length is None:
-            # A stream with unknown length; have to keep two buffers around
-            prevbuffer = bofbuffer
-            while True:
-                buffer = self.blocking_read(stream, self.bufsize)
-                bytes_read += len(buffer)
-                if len(buffer) == self.bufsize:
-                    prevbuffer = buffer
-                else:
-                    eofbuffer = prevbuffer if len(buffer) == 0 else prevbuffer[-(self.bufsize - len(buffer)):] + buffer
-                    break
-            return bofbuffer, eofbuffer, bytes_read
-        bytes_unread = length - len(bofbuffer)
-        if bytes_unread == 0:
+            # A stream with unknown length: read the rest of it into two
+            # buffers in turn, the last full one holding the bytes before
+            # those of the current one
             eofbuffer = bofbuffer
-        elif bytes_unread < self.bufsize:
-            # The buffs overlap
-            eofbuffer = bofbuffer[bytes_unread:] + self.blocking_read(stream, bytes_unread)
-        elif bytes_unread == self.bufsize:
-            eofbuffer = self.blocking_read(stream, self.bufsize)
-        elif seekable:  # easy case when we can just seek!
-            stream.seek(length - self.bufsize)
-            eofbuffer = self.blocking_read(stream, self.bufsize)
+            if bytes_read == bytes_to_read:
+                buffers = self.scratch_buffers()
+                last = bofbuffer
+                while True:
+                    buffer = buffers[0] if last is not buffers[0] else buffers[1]
+                    count = self.read_into(stream, memoryview(buffer))
+                    bytes_read += count
+                    if count < self.bufsize:
+                        break
+                    last = buffer
+                if count or last is not bofbuffer:
+                    eofbuffer = bytearray(self.bufsize)
+                    eofbuffer[:self.bufsize - count] = memoryview(last)[count:]
+                    eofbuffer[self.bufsize - count:] = memoryview(buffer)[:count]
+            return bofbuffer, eofbuffer, bytes_read
+        if self.lazy_eof and seekable and length > bytes_to_read:
+            eofbuffer = DeferredBuffer(partial(self.get_eof_buffer, stream, length, bofbuffer, seekable))
         else:
-            # We have more to read and know how much.
-            # n*bufsize + r = length
-            (n, r) = divmod(bytes_unread, self.bufsize)
-            # skip n-1*bufsize bytes
-            for unused_i in range(1, n):
-                self.blocking_read(stream, self.bufsize)
-            # skip r bytes
-            self.blocking_read(stream, r)
-            # and read the remaining bufsize bytes into the eofbuffer
-            eofbuffer = self.blocking_read(stream, self.bufsize)
+            eofbuffer = self.get_eof_buffer(stream, length, bofbuffer, seekable)
         return bofbuffer, eofbuffer, bytes_to_read
 
+    def get_eof_buffer(self, stream, length, bofbuffer, seekable=False):
+        """
+        Return the buffer from the end of a stream of known length.
+
+        The stream must be positioned just after bofbuffer, the buffer already
+        read from its beginning, unless it is seekable.
+        """
+        if length == len(bofbuffer):
+            return bofbuffer
+        # Offset in the stream of the first byte of the EOF buffer
+        start = max(0, length - self.get_read_sizes()[1])
+        if not seekable and start > len(bofbuffer):
+            # skip the bytes up to start
+            self.skip(stream, start - len(bofbuffer))
+        eofbuffer = bytearray(length - start)
+        # The buffs may overlap, the EOF buffer then starts with the end of the BOF buffer
+        overlap = max(0, len(bofbuffer) - start)
+        if overlap:
+            eofbuffer[:overlap] = memoryview(bofbuffer)[start:]
+        bytes_read = overlap + self.read_into(stream, memoryview(eofbuffer)[overlap:], start + overlap if seekable else None)
+        if bytes_read < len(eofbuffer):
+            eofbuffer = eofbuffer[:bytes_read]
+        return eofbuffer
+
+    def get_read_sizes(self):
+        """
+        Return the number of bytes to read from the beginning and from the end of a stream.
+
+        This is self.bufsize, or less if no loaded signature can look any further.
+        """
+        engine = self.get_signature_engine()
+        return tuple(self.bufsize if reach is None else min(reach, self.bufsize) for reach in (engine.bof_reach, engine.eof_reach))
+
     def walk_zip(self, filename, fileobj=None, extension=True):
         """
         Identify the type of each item in the zip.
@@ -595,6 +1070,7 @@ class Fido:
         @param filename.
         Call self.handle_matches instead of returning a value.
         """
+        context = self.context
         try:
             with zipfile.ZipFile((fileobj if fileobj else filename), 'r') as zipstream:
                 for item in zipstream.infolist():
@@ -603,17 +1079,17 @@ class Fido:
                     timer = PerfTimer()
                     with zipstream.open(item) as f:
                         item_name = filename + '!' + item.filename
-                        self.current_file = item_name
-                        self.current_filesize = item.file_size
-                        if self.current_filesize == 0:
+                        context.filename = item_name
+                        context.filesize = item.file_size
+                        if context.filesize == 0:
                             sys.stderr.write("FIDO: Zero byte file (empty): Path is: " + item_name + "\n")
                         bofbuffer, eofbuffer, _ = self.get_buffers(f, item.file_size)
                     matches = self.match_formats(bofbuffer, eofbuffer)
-                    if len(matches) > 0 and self.current_filesize > 0:
-                        self.handle_matches(item_name, matches, timer.duration(), "signature")
-                    elif extension and (len(matches) == 0 or self.current_filesize == 0):
+                    if len(matches) > 0 and context.filesize > 0:
+                        self.report_matches(item_name, matches, timer.duration(), "signature")
+                    elif extension and (len(matches) == 0 or context.filesize == 0):
                         matches = self.match_extensions(item_name)
-                        self.handle_matches(item_name, matches, timer.duration(), "extension")
+                        self.report_matches(item_name, matches, timer.duration(), "extension")
                     if self.container_type(matches):
                         target = tempfile.SpooledTemporaryFile(prefix='Fido')
                         with zipstream.open(item) as source:
@@ -633,6 +1109,7 @@ class Fido:
         @param filename.
         Call self.handle_matches instead of returning a value.
         """
+        context = self.context
         try:
             with tarfile.TarFile(filename, fileobj=fileobj, mode='r') as tarstream:
                 for item in tarstream.getmembers():
@@ -641,11 +1118,11 @@ class Fido:
                     timer = PerfTimer()
                     with closing(tarstream.extractfile(item)) as f:
                         tar_item_name = filename + '!' + item.name
-                        self.current_file = tar_item_name
-                        self.current_filesize = item.size
+                        context.filename = tar_item_name
+                        context.filesize = item.size
                         bofbuffer, eofbuffer, _ = self.get_buffers(f, item.size)
                         matches = self.match_formats(bofbuffer, eofbuffer)
-                        self.handle_matches(tar_item_name, matches, timer.duration())
+                        self.report_matches(tar_item_name, matches, timer.duration())
                         if self.container_type(matches):
                             f.seek(0)
                             self.identify_contents(tar_item_name, f, self.container_type(matches), extension=extension)
@@ -667,85 +1144,177 @@ class Fido:
                     return False
         return True
 
-    def buffered_read(self, file_pos, overlap):
-        """Buffered read of data chunks."""
-        buf = ""
-        if not overlap:
-            bufsize = self.container_bufsize
-        else:
-            bufsize = self.container_bufsize + overlap
-        file_end = self.current_filesize
-        with open(self.current_file, 'rb') as file_handle:
-            file_handle.seek(file_pos)
-            if file_end - file_pos < bufsize:
-                file_read = file_end - file_pos
-            else:
-                file_read = self.bufsize
-            buf = file_handle.read(file_read)
-        return buf
+    def buffered_read(self, stream, start, length, overlap=0):
+        """
+        Yield the bytes of a seekable stream of length bytes from offset start, in chunks.
+
+        Each chunk holds up to self.container_bufsize new bytes, after the last
+        overlap bytes of the chunk before it.  The chunks are memoryviews of a
+        single buffer, which is overwritten by the next chunk.
+        """
+        size = self.container_bufsize + overlap
+        view = memoryview(bytearray(size))
+        kept = 0
+        offset = start
+        while offset < length:
+            count = kept + self.read_into(stream, view[kept:min(size, kept + length - offset)], offset)
+            if count == kept:
+                return
+            yield view[:count]
+            offset += count - kept
+            kept = min(overlap, count)
+            view[:kept] = view[count - kept:count]
 
-    def match_formats(self, bofbuffer, eofbuffer):
+    def scan_stream(self, stream, length, start, undecided):
+        """
+        Search a seekable stream of length bytes from offset start for the missing patterns of undecided signatures.
+
+        undecided is a list of (signature, missing patterns), as passed by
+        SignatureEngine.match to its scan function.  The stream is read with
+        buffered_read, the chunks overlapping by the longest span of the
+        patterns less one byte, so that every match is within a chunk.
+        @return the signatures whose missing patterns are all found.
+        """
+        overlap = _scan_overlap(undecided)
+        return self.scan_chunks(self.buffered_read(stream, max(0, start - overlap), length, overlap), undecided)
+
+    def scan_view(self, view, start, undecided):
+        """Search a memoryview of a whole file from offset start for the missing patterns of undecided signatures, see scan_stream."""
+        chunk = view[max(0, start - _scan_overlap(undecided)):]
+        try:
+            return self.scan_chunks([chunk], undecided)
+        finally:
+            chunk.release()
+
+    def scan_file(self, filename, length, start, undecided):
+        """Search the file filename of length bytes from offset start for the missing patterns of undecided signatures, see scan_stream."""
+        with open(filename, 'rb', 0) as f:
+            return self.scan_stream(f, length, start, undecided)
+
+    def scan_chunks(self, chunks, undecided):
+        """
+        Search the chunks of a stream for the missing patterns of undecided signatures, see scan_stream.
+
+        Stops reading chunks once the patterns of every signature are found.
+        @return the signatures whose missing patterns are all found.
+        """
+        found = []
+        for chunk in chunks:
+            pending = []
+            for signature, patterns in undecided:
+                patterns = [pattern for pattern in patterns if not pattern.test(chunk)]
+                if patterns:
+                    pending.append((signature, patterns))
+                else:
+                    found.append(signature)
+            undecided = pending
+            if not undecided:
+                break
+        return found
+
+    def match_stream(self, stream, length, seekable=False):
+        """
+        Read the buffers from a stream of known length and apply the patterns for formats to them.
+
+        If self.read_step is set and the stream is seekable, the beginning of
+        the stream is read in doubling steps, until enough of it has been read
+        to decide which signatures match.
+        If self.var_scan is set and the stream is seekable, the rest of it is
+        scanned for the VAR patterns not found in its beginning.
+        @return a match list as returned by match_formats.
+        """
+        bofbuffer, eofbuffer, _ = self.get_buffers(stream, length, seekable)
+        bof_size = min(length, self.get_read_sizes()[0])
+        step = len(bofbuffer)
+        complete = len(bofbuffer) >= bof_size
+        while True:
+            scan = partial(self.scan_stream, stream, length, len(bofbuffer)) if self.var_scan and seekable and length > len(bofbuffer) else None
+            matches = self.match_formats(bofbuffer, eofbuffer, bof_complete=complete, scan=scan)
+            if matches is not None:
+                return matches
+            step *= 2
+            size = min(step, bof_size)
+            # Take the bytes that were already read into the EOF buffer from there
+            eof = eofbuffer.buffer if isinstance(eofbuffer, DeferredBuffer) else eofbuffer
+            eof_start = length if eof is None else length - len(eof)
+            if eof_start > len(bofbuffer):
+                bofbuffer += self.blocking_read(stream, min(size, eof_start) - len(bofbuffer), len(bofbuffer))
+            if size > len(bofbuffer):
+                bofbuffer += eof[len(bofbuffer) - eof_start:size - eof_start]
+            # A stream that ends before its length, such as a file truncated
+            # since its size was taken, has nothing more to read
+            complete = len(bofbuffer) >= bof_size or len(bofbuffer) < size
+
+    def match_mapped_file(self, file):
+        """
+        Apply the patterns for formats to a read-only memory map of file, a non-empty regular file.
+
+        The buffers are views of the map rather than copies, so only the
+        pages of the file that the patterns look at are read, from the page
+        cache if they are there.  Files that cannot be mapped, such as some
+        files of pseudo file systems, are read as by match_stream.
+        @return a match list as returned by match_formats.
+        """
+        bof_size, eof_size = self.get_read_sizes()
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            return self.match_stream(file, os.fstat(file.fileno()).st_size, seekable=True)
+        try:
+            length = len(mapped)
+            scan = partial(self.scan_stream, file, length, bof_size) if self.var_scan and length > bof_size else None
+            if PY2:
+                # The mmap of Python 2 cannot be viewed by a memoryview
+                return self.match_formats(mapped[:bof_size], mapped[max(0, length - eof_size):], scan=scan)
+            view = memoryview(mapped)
+            bofbuffer, eofbuffer = view[:bof_size], view[max(0, length - eof_size):]
+            if scan is not None:
+                # The rest of the file is already mapped, it is searched at once
+                scan = partial(self.scan_view, view, bof_size)
+            try:
+                return self.match_formats(bofbuffer, eofbuffer, scan=scan)
+            finally:
+                # The map cannot be closed while it is viewed
+                bofbuffer.release()
+                eofbuffer.release()
+                view.release()
+        finally:
+            mapped.close()
+
+    def match_formats(self, bofbuffer, eofbuffer, bof_complete=True, scan=None):
         """
         Apply the patterns for formats to the supplied buffers.
 
+        If bof_complete is False, bofbuffer only holds the first bytes of the
+        buffer from the beginning of the stream, and None is returned if they
+        are not enough to decide which signatures match.
+        If scan is given, it searches the rest of the stream for the patterns
+        missing from bofbuffer, see SignatureEngine.match.
+        The signatures too long for the stream, of self.current_filesize bytes
+        or at least those of the buffers, are not tried.
         @return a match list of (format, signature) tuples.
         The list has inferior matches removed.
         """
-        self.current_count += 1
-        result = []
-        for format in self.formats:
-            try:
-                self.current_format = format
-                if self.as_good_as_any(format, result):
-                    for sig in self.get_signatures(format):
-                        self.current_sig = sig
-                        success = True
-                        for pat in self.get_patterns(sig):
-                            self.current_pat = pat
-                            pos = self.get_pos(pat)
-                            regex = self.get_regex(pat)
-                            # print 'trying ', regex
-                            if pos == 'BOF':
-                                if not re.match(regex, bofbuffer):
-                                    success = False
-                                    break
-                            elif pos == 'EOF':
-                                if not re.search(regex, eofbuffer):
-                                    success = False
-                                    break
-                            elif pos == 'VAR':
-                                if not re.search(regex, bofbuffer):
-                                    success = False
-                                    break
-                            elif pos == 'IFB':
-                                if not re.search(regex, bofbuffer):
-                                    success = False
-                                    break
-                        if success:
-                            result.append((format, sig.findtext("name")))
-            except Exception as e:
-                sys.stderr.write(str(e) + "\n")
-                continue
-            # TODO: MdR: needs some <3
-            # print "Unexpected error:", sys.exc_info()[0], e
-            # sys.stdout.write('***', self.get_puid(format), regex)
-
-        result = [match for match in result if self.as_good_as_any(match[0], result)]
-        return result
+        length = max(self.current_filesize or 0, len(bofbuffer), 0 if eofbuffer.__class__ is DeferredBuffer else len(eofbuffer))
+        signatures = self.get_signature_engine().match(bofbuffer, eofbuffer, bof_complete, scan, length)
+        if signatures is None:
+            return None
+        with self._count_lock:
+            self.current_count += 1
+        return self.get_signature_engine().best([(sig.format, sig.name) for sig in signatures])
 
     def match_extensions(self, filename):
-        """Return the list of (format, self.externalsig) for every format whose extension matches the filename."""
+        """
+        Return the list of (format, self.externalsig) for every format whose extension matches the filename.
+
+        Extensions are compared regardless of case, through the extension
+        index of the signature engine, and the list has inferior matches removed.
+        """
         myext = os.path.splitext(filename)[1].lower().lstrip(".")
-        result = []
         if not myext:
-            return result
-        for element in self.formats:
-            for format_ in element.findall('extension'):
-                if myext == format_.text:
-                    result.append((element, self.externalsig.findtext("name")))
-                    break
-        result = [match for match in result if self.as_good_as_any(match[0], result)]
-        return result
+            return []
+        name = self.externalsig.findtext("name")
+        return [(format, name) for format in self.get_signature_engine().extension_index.get(myext, ())]
 
     def copy_stream(self, source, target):
         """Copy the stream from source to target."""
@@ -756,6 +1325,21 @@ class Fido:
             target.write(buf)
 
 
+def _scan_overlap(undecided):
+    """Return the number of bytes by which the chunks scanned for the missing patterns of undecided signatures overlap."""
+    return max(pattern.span for _, patterns in undecided for pattern in patterns) - 1
+
+
+def _file_descriptor(stream):
+    """Return the file descriptor of stream if it is a file that os.preadv can read, None otherwise."""
+    if not hasattr(os, 'preadv'):
+        return None
+    raw = getattr(stream, 'raw', stream)
+    if isinstance(raw, io.FileIO) and not raw.closed:
+        return raw.fileno()
+    return None
+
+
 def list_files(roots, recurse=False):
     """Return the files one at a time. Roots could be a fileobj or a list."""
     for root in roots:
@@ -771,6 +1355,71 @@ def list_files(roots, recurse=False):
                     break
 
 
+class PrefetchedFile(object):
+    """The buffers of a file, read by a prefetch thread of Fido.identify_prefetched_files."""
+
+    def __init__(self, fido, filename):
+        """Instantiate for filename, to be read with fido."""
+        self.fido = fido
+        self.filename = filename
+        self.buffers = None
+        # The sys.exc_info() of the exception met reading the buffers, if any
+        self.error = None
+        self.done = threading.Event()
+
+    def read(self):
+        """Read the buffers."""
+        try:
+            self.buffers = self.fido.read_buffers(self.filename)
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            self.done.set()
+
+    def result(self):
+        """Wait for the buffers to be read and return (size, bofbuffer, eofbuffer), or raise the exception met reading them."""
+        self.done.wait()
+        if self.error is not None:
+            reraise(*self.error)
+        return self.buffers
+
+
+# Number of files handed to a worker process of Fido.identify_files at a time
+WORKER_CHUNKSIZE = 8
+
+# The Fido instance of a worker process of Fido.identify_files
+_worker_fido = None
+
+
+def _init_worker(fido):
+    """Set up a worker process of Fido.identify_files."""
+    global _worker_fido
+    # Interrupts are handled by the parent process, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_fido = fido
+
+
+def _identify_in_worker(job):
+    """
+    Identify a file in a worker process, return its output and the number of files matched.
+
+    If the job forwards the matches, the output is the list of the arguments
+    of Fido.handle_worker_matches for each call of the match handler,
+    otherwise it is that of print_matches.
+    """
+    filename, extension, forward = job
+    fido = _worker_fido
+    output = []
+    if forward:
+        fido.handle_matches = lambda fullname, matches, delta_t, matchtype='': output.append(
+            (fullname, [(fido.get_puid(format), sig_name) for format, sig_name in matches], delta_t, matchtype, fido.context.filesize))
+    else:
+        fido.handle_matches = lambda *args: output.append(fido.format_matches(*args))
+    count = fido.current_count
+    fido.identify_file(filename, extension=extension)
+    return output if forward else ''.join(output), fido.current_count - count
+
+
 def set_up_platform():
     """Enable Unicode display when running Python from Windows console."""
     if platform.system() == 'Windows' and PY2:
@@ -791,6 +1440,15 @@ def main(args=None):
     parser.add_argument('-zip', default=False, action='store_true', help='recurse into zip and tar files')
     parser.add_argument('-noextension', default=False, action='store_true', help='disable extension matching, reduces number of matches but may reduce false positives')
     parser.add_argument('-nocontainer', default=False, action='store_true', help='disable deep scan of container documents, increases speed but may reduce accuracy with big files')
+    parser.add_argument('-readstep', type=int, default=None, help='read the beginning of a file in steps starting at this size (in bytes), stopping once the signatures are decided, reduces I/O on slow storage (default: read bufsize bytes at once)')
+    parser.add_argument('-lazyeof', default=False, action='store_true', help='only read the end of a file when a signature matching its beginning needs it, reduces I/O on slow storage but skips signatures that only test the end of a file')
+    parser.add_argument('-mmap', default=False, action='store_true', help='match signatures against a memory map of each file rather than copies of its beginning and end, only reading the pages they look at (ignores -lazyeof and -readstep, not used with -prefetch)')
+    parser.add_argument('-varscan', default=False, action='store_true', help='search the rest of a file for the VAR signature patterns of bounded length not found in its first bufsize bytes, in chunks of container_bufsize bytes, for the signatures that only lack them')
+    parser.add_argument('-workers', type=int, default=None, metavar='N', help='identify files in N parallel processes (default: 1)')
+    parser.add_argument('-unordered', default=False, action='store_true', help='with -workers, print the results as the files complete rather than in input order')
+    parser.add_argument('-prefetch', type=int, default=None, metavar='N', help='read the next N files in N threads while matching the current one, hides I/O latency on network storage (ignores -lazyeof and -readstep, not used with -workers)')
+    parser.add_argument('-serve', default=None, metavar='SOCKET', help='keep running and identify the files sent by fido-client to the Unix socket SOCKET, rather than loading the signatures for each run')
+    parser.add_argument('-nocache', default=False, action='store_true', help='do not load nor save the compiled signatures in the signature cache, see README')
     parser.add_argument('-pronom_only', default=False, action='store_true', help='disables loading of format extensions file, only PRONOM signatures are loaded, may reduce accuracy of results')
 
     group = parser.add_mutually_exclusive_group()
@@ -857,7 +1515,12 @@ def main(args=None):
         printnomatch=args.nomatchprintf,
         zip=args.zip,
         nocontainer=args.nocontainer,
-        conf_dir=args.confdir)
+        conf_dir=args.confdir,
+        lazy_eof=args.lazyeof,
+        read_step=args.readstep,
+        signature_cache=not args.nocache,
+        use_mmap=args.mmap,
+        var_scan=args.varscan)
 
     # TODO: Allow conf options to be dis-included
     if args.loadformats:
@@ -883,15 +1546,18 @@ def main(args=None):
         if not args.q:
             sys.stderr.write(versionHeader)
             sys.stderr.flush()
-        if (not args.input) and len(args.files) == 1 and args.files[0] == '-':
+        if args.serve:
+            from fido.daemon import serve  # noqa: E402
+            serve(fido, args.serve, extension=not args.noextension)
+        elif (not args.input) and len(args.files) == 1 and args.files[0] == '-':
             if fido.zip:
                 raise RuntimeError("Multiple content read from stdin not yet supported.")
                 fido.identify_multi_object_stream(sys.stdin, extension=not args.noextension)
             else:
-                fido.identify_stream(sys.stdin, args.filename, extension=not args.noextension)
+                fido.identify_stream(getattr(sys.stdin, 'buffer', sys.stdin), args.filename, extension=not args.noextension)
         else:
-            for file in list_files(args.files, args.recurse):
-                fido.identify_file(file, extension=not args.noextension)
+            fido.identify_files(list_files(args.files, args.recurse), extension=not args.noextension, workers=args.workers, ordered=not args.unordered,
+                                prefetch=args.prefetch)
     except KeyboardInterrupt:
         sys.stdout.flush()
         sys.stderr.flush()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+FIDO: Format Identifier for Digital Objects.
+
+Copyright 2010 The Open Preservation Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compact records of the <format> elements of the format files.
+"""
+from __future__ import absolute_import
+
+from xml.etree import ElementTree as ET
+
+
+class FormatRecord(object):
+    """
+    A <format> element holding in memory only the children that identifying files needs.
+
+    The record answers find, findall and findtext like the element for the
+    tags it holds, and anything else, such as the <details> of the format,
+    from the whole element, which is only decoded from its source when first
+    needed.  The single children are held as their text, '' for a child
+    without text and None for a missing child, the others as tuples of texts.
+    """
+
+    __slots__ = ('puid', 'name', 'mimes', 'version', 'alias', 'apple_uti', 'container', 'extensions', 'priorities', 'source',
+                 '_children', '_element')
+
+    tag = 'format'
+
+    # The tags held by a record, and the attribute holding their texts
+    HELD = {'puid': 'puid', 'name': 'name', 'mime': 'mimes', 'version': 'version', 'alias': 'alias', 'apple_uti': 'apple_uti',
+            'container': 'container', 'extension': 'extensions', 'has_priority_over': 'priorities'}
+
+    SINGLE = ('name', 'version', 'alias', 'apple_uti', 'container')
+
+    def __init__(self, fields, source):
+        """
+        Instantiate the record of a format from the fields of its element, as returned by fields.
+
+        @param source is called without arguments to decode the whole element.
+        """
+        (self.puid, self.name, self.mimes, self.version, self.alias, self.apple_uti, self.container, self.extensions,
+         self.priorities) = fields
+        self.source = source
+        self._children = None
+        self._element = None
+
+    @classmethod
+    def fields(cls, element):
+        """Return the fields of the record of a format element."""
+        def single(tag):
+            child = element.find(tag)
+            return None if child is None else child.text or ''
+
+        def texts(tag):
+            return tuple(child.text for child in element.findall(tag))
+
+        return (element.findtext('puid'), single('name'), texts('mime'), single('version'), single('alias'), single('apple_uti'),
+                single('container'), texts('extension'), texts('has_priority_over'))
+
+    def texts(self, tag):
+        """Return the texts of the children of a held tag."""
+        texts = getattr(self, self.HELD[tag])
+        if tag == 'puid':
+            return (texts,)
+        if tag in self.SINGLE:
+            return () if texts is None else (texts or None,)
+        return texts
+
+    def children(self, tag):
+        """Return the elements of the children of a held tag."""
+        if self._children is None:
+            self._children = {}
+        children = self._children.get(tag)
+        if children is None:
+            children = self._children[tag] = []
+            for text in self.texts(tag):
+                child = ET.Element(tag)
+                child.text = text
+                children.append(child)
+        return children
+
+    def element(self):
+        """Return the whole element, decoding it on first use."""
+        if self._element is None:
+            self._element = self.source()
+        return self._element
+
+    def find(self, path, namespaces=None):
+        """Find the first child matching path, see Element.find."""
+        if path in self.HELD:
+            children = self.children(path)
+            return children[0] if children else None
+        return self.element().find(path, namespaces)
+
+    def findall(self, path, namespaces=None):
+        """Find all the children matching path, see Element.findall."""
+        if path in self.HELD:
+            return list(self.children(path))
+        return self.element().findall(path, namespaces)
+
+    def findtext(self, path, default=None, namespaces=None):
+        """Find the text of the first child matching path, see Element.findtext."""
+        if path in self.HELD:
+            texts = self.texts(path)
+            return (texts[0] or '') if texts else default
+        return self.element().findtext(path, default, namespaces)
+
+    def __getattr__(self, name):
+        """Return any other attribute of the element, such as iter or attrib."""
+        if name in self.__slots__:
+            raise AttributeError(name)
+        return getattr(self.element(), name)
+
+    def __bool__(self):
+        """Return True, unlike an element without children, which is false."""
+        return True
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        """Iterate over the children of the element."""
+        return iter(self.element())
+
+    def __len__(self):
+        """Return the number of children of the element."""
+        return len(self.element())
+
+    def __getitem__(self, index):
+        """Return the child of the element at index."""
+        return self.element()[index]
+
+    def __getstate__(self):
+        """Return the state to pickle, without the decoded element."""
+        return tuple(getattr(self, slot) for slot in self.__slots__[:-2])
+
+    def __setstate__(self, state):
+        """Restore a pickled record."""
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+        self._children = None
+        self._element = None
+
+
+class FormatFile(object):
+    """A format file, parsed again when the whole of one of its format elements is needed."""
+
+    def __init__(self, path):
+        """Instantiate for the format file at path."""
+        self.path = path
+        self.elements = None
+
+    def element(self, index):
+        """Return the format element at index in the file, parsing the file on first use."""
+        if self.elements is None:
+            self.elements = ET.parse(self.path).getroot().findall('./format')
+        return self.elements[index]
+
+    def __getstate__(self):
+        """Return the state to pickle, without the parsed elements."""
+        return self.path
+
+    def __setstate__(self, state):
+        """Restore a pickled format file."""
+        self.path = state
+        self.elements = None
+
+
+class FileEntry(object):
+    """The source of a FormatRecord, decoding its element from a FormatFile."""
+
+    __slots__ = ('file', 'index')
+
+    def __init__(self, file, index):
+        """Instantiate for the format element at index in file."""
+        self.file = file
+        self.index = index
+
+    def __call__(self):
+        """Return the element."""
+        return self.file.element(self.index)
+
+    def __getstate__(self):
+        """Return the state to pickle."""
+        return (self.file, self.index)
+
+    def __setstate__(self, state):
+        """Restore a pickled entry."""
+        self.file, self.index = state
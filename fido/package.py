@@ -1,63 +1,123 @@
 """Support for containers."""
 
-import re
+from __future__ import absolute_import
+
 import zipfile
 
 import olefile
 from six import iteritems
 
+from fido.signatures import END, LOOKAROUND, parse_regex, RegexCache, START, UnsupportedRegex, width
 
-class Package():
-    """Base class for container support."""
 
-    def _process_puid_map(self, data, puid_map):
-        results = []
-        for puid, signatures in iteritems(puid_map):
-            results.extend(self._process_matches(data, puid, signatures))
+def signature_overlap(signature):
+    """
+    Return the bytes of a chunk to carry over for a match of the container signature regex to straddle two chunks.
 
-        return results
+    None is returned if the regex may match more than a bounded number of
+    bytes, or sees the edges of a chunk.
+    """
+    try:
+        atoms = parse_regex(signature)
+    except UnsupportedRegex:
+        return None
+    maximum = width(atoms)[1]
+    # Anchors and lookarounds would also see the edges of a chunk
+    if maximum is None or START in atoms or END in atoms or LOOKAROUND in atoms:
+        return None
+    return max(0, maximum - 1)
+
+
+class Package():
+    """Base class for container support."""
 
-    def _process_matches(self, data, puid, signatures):
-        results = []
-        for signature in signatures:
-            if re.search(signature["signature"], data):
-                results.append(puid)
+    def __init__(self, signatures, regex_cache=None, bufsize=None):
+        """
+        Instantiate Package object given its signatures.
 
-        return results
+        The signatures map each path inside the container to a {puid: [signature]} map.
+        If bufsize is given, the files inside the container are read in chunks
+        of that many bytes, and only until every signature of their path matched.
+        """
+        self.signatures = signatures
+        self.regex_cache = RegexCache() if regex_cache is None else regex_cache
+        self.bufsize = bufsize
+        # Compile the regexes of each path once, rather than for every match
+        self.regexes = dict((path, self._compile_puid_map(puid_map)) for path, puid_map in iteritems(signatures))
+        # A match may straddle two chunks; carry over enough of the previous
+        # chunk for the longest one (None if there is no bound).
+        self.overlaps = dict((path, self._get_overlap(puid_map)) for path, puid_map in iteritems(signatures))
+
+    def _compile_puid_map(self, puid_map):
+        return [(puid, [signature.get("regex") or self.regex_cache.compile(signature["signature"]) for signature in signatures])
+                for puid, signatures in iteritems(puid_map)]
+
+    def _get_overlap(self, puid_map):
+        overlap = 0
+        for signatures in puid_map.values():
+            for signature in signatures:
+                maximum = signature["overlap"] if "overlap" in signature else signature_overlap(signature["signature"])
+                if maximum is None:
+                    return None
+                overlap = max(overlap, maximum)
+        return overlap
+
+    def _process_stream(self, stream, path):
+        """Return the puids whose signatures for path match the file read from stream."""
+        regexes = self.regexes[path]
+        overlap = self.overlaps[path]
+        bufsize = -1 if self.bufsize is None or overlap is None else self.bufsize
+        # Identical signatures share their compiled regex
+        pending = set(regex for _, puid_regexes in regexes for regex in puid_regexes)
+        matched = set()
+        data = stream.read(bufsize)
+        while True:
+            for regex in list(pending):
+                if regex.search(data):
+                    matched.add(regex)
+                    pending.discard(regex)
+            if not pending:
+                break
+            chunk = stream.read(bufsize)
+            if not chunk:
+                break
+            data = data[max(0, len(data) - overlap):] + chunk
+        return [puid for puid, puid_regexes in regexes for regex in puid_regexes if regex in matched]
 
 
 class OlePackage(Package):
     """OlePackage supports OLE containers."""
 
-    def __init__(self, ole, signatures):
+    def __init__(self, ole, signatures, regex_cache=None, bufsize=None):
         """Instantiate OlePackage object given the location of its file and signatures."""
+        Package.__init__(self, signatures, regex_cache, bufsize)
         self.ole = ole
-        self.signatures = signatures
 
     def detect_formats(self):
         """Detect available formats inside the OLE container."""
         try:
             with olefile.OleFileIO(self.ole) as ole:
+                # Each OLE container signature lists the path of the file inside the OLE
+                # on which it operates; if the file is missing, there can be no match.
+                # This is not a precise match because the name of the stream may slightly
+                # differ; for example, \x01CompObj instead of CompObj.  Index the streams
+                # under both names once, the first stream found for a name winning.
+                streams = {}
+                for paths in ole.listdir():
+                    p = '/'.join(paths)
+                    streams.setdefault(p, p)
+                    streams.setdefault(p[1:], p)
+
                 results = []
-                for path, puid_map in iteritems(self.signatures):
-                    # Each OLE container signature lists the path of the file inside the OLE
-                    # on which it operates; if the file is missing, there can be no match.
-                    # This is not a precise match because the name of the stream may slightly
-                    # differ; for example, \x01CompObj instead of CompObj
-                    filepath = None
-                    for paths in ole.listdir():
-                        p = '/'.join(paths)
-                        if p == path or p[1:] == path:
-                            filepath = p
-                            break
+                for path in self.regexes:
+                    filepath = streams.get(path)
 
                     # Path to match isn't in the container at all
                     if filepath is None:
                         continue
 
                     with ole.openstream(filepath) as stream:
-                        contents = stream.read()
-                        results.extend(self._process_puid_map(contents, puid_map))
+                        results.extend(self._process_stream(stream, path))
 
                 return results
         except IOError:
@@ -67,27 +127,27 @@ class OlePackage(Package):
 class ZipPackage(Package):
     """ZipPackage supports Zip containers."""
 
-    def __init__(self, zip_, signatures):
+    def __init__(self, zip_, signatures, regex_cache=None, bufsize=None):
         """Instantiate ZipPackage object given the location of its file and signatures."""
+        Package.__init__(self, signatures, regex_cache, bufsize)
         self.zip = zip_
-        self.signatures = signatures
 
     def detect_formats(self):
         """Detect available formats inside the ZIP container."""
         try:
             with zipfile.ZipFile(self.zip) as zip_:
+                names = frozenset(zip_.namelist())
                 results = []
-                for path, puid_map in iteritems(self.signatures):
+                for path in self.regexes:
                     # Each ZIP container signature lists the path of the file inside the ZIP
                     # on which it operates; if the file is missing, there can be no match.
-                    if path not in zip_.namelist():
+                    if path not in names:
                         continue
 
                     # Extract the requested file from the ZIP only once, and pass the same
                     # data to each signature that requires it.
                     with zip_.open(path) as id_file:
-                        contents = id_file.read()
-                        results.extend(self._process_puid_map(contents, puid_map))
+                        results.extend(self._process_stream(id_file, path))
 
                 return results
         except (zipfile.BadZipfile, RuntimeError, UnicodeDecodeError):
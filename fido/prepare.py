@@ -7,6 +7,7 @@ from __future__ import print_function
 
 from argparse import ArgumentParser
 import hashlib
+import os
 import sys
 from xml.dom import minidom
 from xml.etree import ElementTree as ET
@@ -17,6 +18,7 @@ from six.moves.urllib.request import urlopen
 from six.moves.urllib.parse import urlparse
 from six.moves.urllib.error import HTTPError
 
+from .fido import Fido
 from .versions import get_local_versions
 from .char_handler import escape
 
@@ -715,6 +717,8 @@ def run(input=None, output=None, puid=None):
     info.load_pronom_xml(puid)
     info.save(output)
     print('Converted {0} PRONOM formats to FIDO signatures'.format(len(info.formats)), file=sys.stderr)
+    # Compile the new signatures into the signature cache now, rather than on the next run of fido
+    Fido(quiet=True, format_files=[os.path.abspath(output)])
 
 
 def main(args=None):
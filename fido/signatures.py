@@ -0,0 +1,774 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiled signatures for Format Identification for Digital Objects (FIDO).
+
+The format XML is walked once, when it is loaded, and every signature is
+turned into a compact record holding pre-compiled byte regexes.  Matching a
+file is then a loop over these records, without any ElementTree lookups.
+"""
+
+from __future__ import absolute_import
+
+import re
+import sys
+
+
+# Atoms of a parsed regex are (min_width, max_width, literal) tuples.  The
+# literal is the matched byte for atoms that match exactly one fixed byte and
+# None otherwise; max_width is None for unbounded repetitions.  The anchors
+# and lookarounds are zero-width atoms identified by these constants.  Their
+# tags are str, which is bytes on Python 2: use literal_byte() to get the
+# literal of an atom.
+START = (0, 0, 'start')
+END = (0, 0, 'end')
+LOOKAROUND = (0, 0, 'lookaround')
+ZERO_WIDTH = (START, END, LOOKAROUND)
+
+_ESCAPES = {'n': b'\n', 'r': b'\r', 't': b'\t', 'f': b'\f', 'v': b'\v', 'a': b'\a'}
+_CLASS_ESCAPES = 'dDsSwW'
+_QUANTIFIER = re.compile(r'\{(\d+)\}|\{(\d*),(\d*)\}')
+
+# Number of leading literal bytes used as the key of the BOF prefix index
+PREFIX_KEY_LENGTH = 4
+
+
+class UnsupportedRegex(ValueError):
+    """Raised by parse_regex for syntax that the analysis does not cover."""
+
+
+def parse_regex(regex):
+    """
+    Split a FIDO regex (bytes) into a list of top-level atoms.
+
+    Only the subset of the regex syntax produced by fido.prepare and used in
+    the format files is understood; anything else raises UnsupportedRegex, in
+    which case the regex is simply not used for any index.
+    """
+    atoms, _, _ = _parse_regex(regex)
+    return atoms
+
+
+def bounded_head(regex):
+    """
+    Return the leading atoms of a regex up to its first unbounded atom, anchor or lookaround, as a regex (bytes).
+
+    Whenever the regex matches at some position, so does its head.  None is
+    returned if the head would not match any byte.
+    """
+    atoms, flags, ends = _parse_regex(regex)
+    count = 0
+    while count < len(atoms) and atoms[count][1] is not None and atoms[count] not in (END, LOOKAROUND):
+        count += 1
+    if width([atom for atom in atoms[:count] if atom is not START])[1] == 0:
+        return None
+    return regex[:flags + ends[count - 1]]
+
+
+def _parse_regex(regex):
+    """Return (atoms, length of the leading flags group, end offset of each atom in the remaining text)."""
+    text = regex.decode('latin-1')
+    flags = 0
+    if text.startswith('(?'):
+        end = text.find(')')
+        if end < 0 or not set(text[2:end]) <= set('sm'):
+            raise UnsupportedRegex(regex)
+        flags = end + 1
+        text = text[flags:]
+    ends = []
+    atoms, i = _parse_sequence(text, 0, ends)
+    if i != len(text):
+        raise UnsupportedRegex(regex)
+    return atoms, flags, ends
+
+
+def _parse_sequence(text, i, ends=None):
+    """
+    Parse atoms from text[i:] up to an unnested '|' or ')', return (atoms, index).
+
+    The index just after each atom is appended to `ends`, if given.
+    """
+    atoms = []
+    while i < len(text) and text[i] not in '|)':
+        c = text[i]
+        if c == '\\':
+            atom, i = _parse_escape(text, i + 1)
+        elif c == '.':
+            atom, i = (1, 1, None), i + 1
+        elif c == '[':
+            atom, i = _parse_class(text, i + 1)
+        elif c == '(':
+            atom, i = _parse_group(text, i + 1)
+        elif c in '^$*+?{':
+            raise UnsupportedRegex(text)
+        else:
+            atom, i = (1, 1, c.encode('latin-1')), i + 1
+        atom, i = _parse_quantifier(text, i, atom)
+        atoms.append(atom)
+        if ends is not None:
+            ends.append(i)
+    return atoms, i
+
+
+def _parse_escape(text, i):
+    c = text[i:i + 1]
+    if c == 'x':
+        try:
+            return (1, 1, bytes(bytearray([int(text[i + 1:i + 3], 16)]))), i + 3
+        except ValueError:
+            raise UnsupportedRegex(text)
+    if c == 'A':
+        return START, i + 1
+    if c == 'Z':
+        return END, i + 1
+    if c in _ESCAPES:
+        return (1, 1, _ESCAPES[c]), i + 1
+    if c and c in _CLASS_ESCAPES:
+        return (1, 1, None), i + 1
+    if c and not c.isalnum():
+        return (1, 1, c.encode('latin-1')), i + 1
+    raise UnsupportedRegex(text)
+
+
+def _parse_class(text, i):
+    """Skip a character class; i points just after the '['."""
+    if text[i:i + 1] == '^':
+        i += 1
+    if text[i:i + 1] == ']':
+        i += 1
+    while i < len(text) and text[i] != ']':
+        i += 2 if text[i] == '\\' else 1
+    if i >= len(text):
+        raise UnsupportedRegex(text)
+    return (1, 1, None), i + 1
+
+
+def _parse_group(text, i):
+    """Parse a group; i points just after the '('."""
+    lookaround = False
+    if text.startswith('?:', i):
+        i += 2
+    elif text.startswith(('?=', '?!'), i):
+        lookaround, i = True, i + 2
+    elif text.startswith(('?<=', '?<!'), i):
+        lookaround, i = True, i + 3
+    elif text.startswith('?', i):
+        raise UnsupportedRegex(text)
+    minimum, maximum = None, 0
+    while True:
+        atoms, i = _parse_sequence(text, i)
+        alt_min, alt_max = width(atoms)
+        minimum = alt_min if minimum is None else min(minimum, alt_min)
+        maximum = None if maximum is None or alt_max is None else max(maximum, alt_max)
+        if i >= len(text):
+            raise UnsupportedRegex(text)
+        if text[i] == ')':
+            break
+        i += 1
+    if lookaround:
+        return LOOKAROUND, i + 1
+    return (minimum, maximum, None), i + 1
+
+
+def _parse_quantifier(text, i, atom):
+    """Apply a quantifier following an atom, if there is one."""
+    c = text[i:i + 1]
+    if c == '{':
+        match = _QUANTIFIER.match(text, i)
+        if match is None:
+            raise UnsupportedRegex(text)
+        if match.group(1) is not None:
+            low = high = int(match.group(1))
+        else:
+            low = int(match.group(2) or 0)
+            high = int(match.group(3)) if match.group(3) else None
+        i = match.end()
+    elif c == '?':
+        low, high, i = 0, 1, i + 1
+    elif c == '*':
+        low, high, i = 0, None, i + 1
+    elif c == '+':
+        low, high, i = 1, None, i + 1
+    else:
+        return atom, i
+    if atom in ZERO_WIDTH:
+        raise UnsupportedRegex(text)
+    # Lazy and possessive modifiers do not change what can match
+    if text[i:i + 1] in ('?', '+'):
+        i += 1
+    maximum = None if high is None or atom[1] is None else atom[1] * high
+    return (atom[0] * low, maximum, None), i
+
+
+def width(atoms):
+    """Return the (minimum, maximum) number of bytes a list of atoms can match; maximum is None if unbounded."""
+    minimum, maximum = 0, 0
+    for atom in atoms:
+        minimum += atom[0]
+        maximum = None if maximum is None or atom[1] is None else maximum + atom[1]
+    return minimum, maximum
+
+
+def literal_byte(atom):
+    """Return the byte matched by an atom that matches one fixed byte, None otherwise."""
+    if atom in ZERO_WIDTH:
+        return None
+    return atom[2]
+
+
+def literal_prefix(atoms):
+    """
+    Return (offset, literal) for an anchored regex starting with fixed-width atoms and a literal.
+
+    The literal is the longest run of fixed bytes following the fixed offset;
+    None is returned if there is no such run.
+    """
+    offset = 0
+    prefix = b''
+    for atom in atoms:
+        if atom[0] != atom[1]:
+            break
+        byte = literal_byte(atom)
+        if byte is not None:
+            prefix += byte
+        elif prefix:
+            break
+        elif atom not in ZERO_WIDTH:
+            offset += atom[0]
+    return (offset, prefix) if prefix else None
+
+
+def literal_suffix(atoms):
+    r"""
+    Return (distance, literal) for a regex ending with a literal followed by fixed-width atoms and \Z.
+
+    The distance is the number of bytes between the end of the literal and the
+    end of the buffer; None is returned if there is no such literal.
+    """
+    if not atoms or atoms[-1] is not END:
+        return None
+    distance = 0
+    suffix = b''
+    for atom in reversed(atoms[:-1]):
+        if atom[0] != atom[1]:
+            break
+        byte = literal_byte(atom)
+        if byte is not None:
+            suffix = byte + suffix
+        elif suffix:
+            break
+        elif atom not in ZERO_WIDTH:
+            distance += atom[0]
+    return (distance, suffix) if suffix else None
+
+
+def literal_fragments(atoms):
+    """
+    Return the runs of fixed bytes that any match of a regex must contain.
+
+    Only runs of at least two bytes are returned, as single bytes are found in
+    almost every buffer.
+    """
+    fragments = []
+    run = b''
+    for atom in atoms + [END]:
+        byte = literal_byte(atom)
+        if byte is not None:
+            run += byte
+            continue
+        if len(run) > 1 and run not in fragments:
+            fragments.append(run)
+        run = b''
+    return tuple(sorted(fragments, key=len, reverse=True))
+
+
+class RegexCache(object):
+    """
+    Compiled regexes, keyed on their source.
+
+    FIDO holds on to its own compiled patterns instead of relying on the
+    bounded cache of the re module, which is shared with the rest of the
+    process.  `hits` and `misses` count the lookups, a regex being compiled
+    on each miss.
+    """
+
+    def __init__(self):
+        """Instantiate an empty cache."""
+        self.compiled = {}
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, regex):
+        """Return the compiled `regex`, compiling it on first use."""
+        compiled = self.compiled.get(regex)
+        if compiled is None:
+            self.misses += 1
+            compiled = self.compiled[regex] = re.compile(regex)
+        else:
+            self.hits += 1
+        return compiled
+
+
+class Pattern(object):
+    """A single compiled pattern of a signature."""
+
+    __slots__ = ('position', 'regex', 'on_eof', 'test', 'prefix', 'suffix', 'window', 'fragments', 'reach', 'final', 'head',
+                 'head_reach', 'limit', 'span', 'min_length')
+
+    def __init__(self, position, regex, cache=None):
+        """Compile `regex` (bytes) for matching at `position` (BOF, EOF, VAR or IFB), through `cache` if given."""
+        compile = re.compile if cache is None else cache.compile
+        self.position = position
+        self.regex = regex
+        compiled = compile(regex)
+        self.on_eof = position == 'EOF'
+        # BOF patterns are anchored at the start of the buffer, all others may
+        # match anywhere within it.
+        self.test = compiled.match if position == 'BOF' else compiled.search
+        self.prefix = None
+        self.suffix = None
+        self.window = None
+        self.fragments = ()
+        # Number of bytes from the start of the BOF buffer that a BOF pattern
+        # can look at (None if unknown or unbounded), and whether a match found
+        # in the start of the BOF buffer is also a match in the whole of it.
+        self.reach = None
+        self.final = False
+        # For BOF patterns without a reach: the match function and reach of
+        # their bounded head, and the size of the largest buffer that a
+        # bounded pattern ending with \Z can match.
+        self.head = None
+        self.head_reach = None
+        self.limit = None
+        # For VAR and IFB patterns: the maximum number of bytes of a match,
+        # if bounded and the pattern does not look beyond its match, so that
+        # it can be searched for in overlapping chunks of a stream.
+        self.span = None
+        # The minimum number of bytes of a match, so that of a stream the
+        # pattern can be found in; 0 if unknown.
+        self.min_length = 0
+        try:
+            atoms = parse_regex(regex)
+        except UnsupportedRegex:
+            return
+        self.min_length = width(atoms)[0]
+        if position != 'EOF':
+            self.final = END not in atoms and LOOKAROUND not in atoms
+        if position == 'BOF':
+            self.prefix = literal_prefix(atoms)
+            if self.final:
+                self.reach = width(atoms)[1]
+            elif END in atoms and LOOKAROUND not in atoms:
+                self.limit = width(atoms)[1]
+            head = bounded_head(regex) if self.reach is None else None
+            if head is not None:
+                self.head = compile(head).match
+                self.head_reach = width(parse_regex(head))[1]
+        elif position == 'EOF' and atoms and atoms[-1] is END:
+            # A match of a \Z anchored pattern can only start within its
+            # maximum width from the end of the buffer; search just there.
+            self.suffix = literal_suffix(atoms)
+            self.window = width(atoms)[1]
+        elif position in ('VAR', 'IFB'):
+            # These are searched for through the whole BOF buffer, which is
+            # only worth doing when the fixed bytes they need are all present.
+            self.fragments = literal_fragments(atoms)
+            if self.final and width(atoms)[1]:
+                self.span = width(atoms)[1]
+
+    def __getstate__(self):
+        """Return the state to pickle, holding the source of the compiled regexes rather than the regexes."""
+        state = dict((slot, getattr(self, slot)) for slot in self.__slots__)
+        del state['test']
+        if self.head.__class__ is LazyMatch:
+            state['head'] = self.head.regex
+        elif self.head is not None:
+            state['head'] = self.head.__self__.pattern
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled pattern, whose regexes are only compiled on first use."""
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self.test = LazyMatch(self, 'test', self.regex, 'match' if self.position == 'BOF' else 'search')
+        if self.head is not None:
+            self.head = LazyMatch(self, 'head', self.head, 'match')
+
+    def use_cache(self, cache):
+        """Compile the regexes of a restored pattern that are not compiled yet through the RegexCache `cache`."""
+        for function in (self.test, self.head):
+            if function.__class__ is LazyMatch:
+                function.cache = cache
+
+
+class LazyMatch(object):
+    """The match or search function of a regex of a Pattern, compiling the regex when first called."""
+
+    __slots__ = ('pattern', 'attribute', 'regex', 'method', 'cache')
+
+    def __init__(self, pattern, attribute, regex, method, cache=None):
+        """Instantiate for `regex`, to be set as `attribute` of `pattern` once compiled through `cache` if given."""
+        self.pattern = pattern
+        self.attribute = attribute
+        self.regex = regex
+        self.method = method
+        self.cache = cache
+
+    def __call__(self, *args):
+        """Compile the regex, replace this by its function in the pattern and call it."""
+        compiled = re.compile(self.regex) if self.cache is None else self.cache.compile(self.regex)
+        function = getattr(compiled, self.method)
+        setattr(self.pattern, self.attribute, function)
+        return function(*args)
+
+
+# Compiled searches for the literal fragments looked for in memoryviews
+_literal_searches = {}
+
+
+def contains(buffer, fragment):
+    """
+    Return True if the bytes fragment is in buffer.
+
+    The buffer may be a memoryview, such as a view of a memory-mapped file,
+    for which the `in` operator compares single items rather than bytes.
+    """
+    if buffer.__class__ is not memoryview:
+        return fragment in buffer
+    search = _literal_searches.get(fragment)
+    if search is None:
+        search = _literal_searches[fragment] = re.compile(re.escape(fragment)).search
+    return search(buffer) is not None
+
+
+class DeferredBuffer(object):
+    """A buffer that is read by calling `read` when it is first needed."""
+
+    __slots__ = ('read', 'buffer')
+
+    def __init__(self, read):
+        """Instantiate with a function returning the buffer."""
+        self.read = read
+        self.buffer = None
+
+    def __call__(self):
+        """Return the buffer, reading it on the first call."""
+        if self.buffer is None:
+            self.buffer = self.read()
+            self.read = None
+        return self.buffer
+
+
+class Signature(object):
+    """
+    A compiled signature: all of its patterns must match.
+
+    `min_length` is the size below which a stream cannot match the signature,
+    that of its longest pattern.
+    """
+
+    __slots__ = ('format', 'puid', 'name', 'patterns', 'min_length')
+
+    def __init__(self, format, puid, name, patterns):
+        """Instantiate a signature of `format` from a tuple of compiled patterns."""
+        self.format = format
+        self.puid = puid
+        self.name = name
+        self.patterns = patterns
+        self.min_length = max([pattern.min_length for pattern in patterns] or [0])
+
+    def prefix(self):
+        """Return the (offset, literal) BOF prefix with the longest literal, or None."""
+        prefixes = [pattern.prefix for pattern in self.patterns if pattern.prefix is not None]
+        return max(prefixes, key=lambda prefix: len(prefix[1])) if prefixes else None
+
+    def suffix(self):
+        """Return the (distance, literal) EOF suffix with the longest literal, or None."""
+        suffixes = [pattern.suffix for pattern in self.patterns if pattern.suffix is not None]
+        return max(suffixes, key=lambda suffix: len(suffix[1])) if suffixes else None
+
+    def match(self, bofbuffer, eofbuffer, found=None, bof_complete=True):
+        """
+        Return True if every pattern matches the supplied buffers.
+
+        `found` caches which literal fragments are present in the BOF buffer;
+        pass the same dictionary when matching several signatures against it.
+        The EOF buffer may be a DeferredBuffer, read by the first EOF pattern.
+        If `bof_complete` is False, `bofbuffer` only holds the first bytes of
+        the BOF buffer and None is returned when they do not decide the match.
+        """
+        found = {} if found is None else found
+        undecided = False
+        for pattern in self.patterns:
+            if pattern.on_eof:
+                if eofbuffer.__class__ is DeferredBuffer:
+                    eofbuffer = eofbuffer()
+                if pattern.window is None:
+                    if not pattern.test(eofbuffer):
+                        return False
+                elif not pattern.test(eofbuffer, max(0, len(eofbuffer) - pattern.window)):
+                    return False
+                continue
+            if not bof_complete and (pattern.reach is None or pattern.reach > len(bofbuffer)):
+                # The whole BOF buffer is longer than the part of it supplied
+                if pattern.limit is not None and pattern.limit < len(bofbuffer):
+                    return False
+                if pattern.head_reach is not None and pattern.head_reach <= len(bofbuffer) and not pattern.head(bofbuffer):
+                    return False
+                if not (pattern.final and pattern.test(bofbuffer)):
+                    undecided = True
+                continue
+            for fragment in pattern.fragments:
+                present = found.get(fragment)
+                if present is None:
+                    present = found[fragment] = contains(bofbuffer, fragment)
+                if not present:
+                    return False
+            if not pattern.test(bofbuffer):
+                return False
+        return None if undecided else True
+
+    def missing(self, bofbuffer, eofbuffer, found=None):
+        """
+        Return the patterns with a span not found in the BOF buffer, if they are all that keeps the signature from matching.
+
+        An empty tuple is returned if any other pattern does not match, or if
+        every pattern matches.  `found` is as for match.
+        """
+        found = {} if found is None else found
+        missing = []
+        for pattern in self.patterns:
+            if pattern.on_eof:
+                if eofbuffer.__class__ is DeferredBuffer:
+                    eofbuffer = eofbuffer()
+                if not pattern.test(eofbuffer, 0 if pattern.window is None else max(0, len(eofbuffer) - pattern.window)):
+                    return ()
+                continue
+            present = True
+            for fragment in pattern.fragments:
+                present = found.get(fragment)
+                if present is None:
+                    present = found[fragment] = contains(bofbuffer, fragment)
+                if not present:
+                    break
+            if not (present and pattern.test(bofbuffer)):
+                if pattern.span is None:
+                    return ()
+                missing.append(pattern)
+        return tuple(missing)
+
+
+def compile_signatures(format, puid, cache=None):
+    """
+    Compile the <signature> elements of a format element, through the RegexCache `cache` if given.
+
+    Signatures containing a regex that cannot be compiled are reported and
+    skipped, as they can never match.
+    @return a tuple of Signature.
+    """
+    signatures = []
+    for sig in format.findall('signature'):
+        patterns = []
+        try:
+            for pat in sig.findall('pattern'):
+                position = pat.findtext('position')
+                if position not in ('BOF', 'EOF', 'VAR', 'IFB'):
+                    continue
+                # The regex is matching bytes from a file so regex must also be bytes
+                patterns.append(Pattern(position, pat.findtext('regex').encode('utf8'), cache))
+        except (re.error, OverflowError) as compile_excep:
+            sys.stderr.write('FIDO: Skipping signature "{}" of {}: {}\n'.format(sig.findtext('name'), puid, compile_excep))
+            continue
+        # Try the EOF patterns last, so that they are only needed once the
+        # rest of the signature has matched.
+        patterns.sort(key=lambda pattern: pattern.on_eof)
+        signatures.append(Signature(format, puid, sig.findtext('name'), tuple(patterns)))
+    return tuple(signatures)
+
+
+class SignatureEngine(object):
+    """
+    The compiled signatures of an ordered list of formats.
+
+    Signatures with a BOF pattern that starts with fixed bytes at a fixed
+    offset are indexed on (offset, leading bytes); for a given file only the
+    indexed signatures whose leading bytes are present in the BOF buffer are
+    tried, along with the signatures that could not be indexed.  Likewise,
+    signatures without such a BOF pattern but with an EOF pattern that ends
+    with fixed bytes at a fixed distance from the end are indexed on
+    (distance, trailing bytes) and looked up in the EOF buffer.
+
+    VAR and IFB patterns are searched for only when the fixed bytes they
+    require are present in the BOF buffer.  Each distinct run of fixed bytes is
+    looked up at most once per file, whichever signatures share it.
+
+    bof_reach and eof_reach are the number of bytes at the start and at the
+    end of a file that the signatures can look at, None if unbounded.
+
+    The formats are numbered in order, and the formats each one has priority
+    over are kept as a bitmask of these numbers, so that the best matches can
+    be picked with a few integer operations.
+
+    extension_index maps each lower-cased extension to the tuple of the
+    formats with that extension that no other of them has priority over.
+
+    Given the length of a stream, the signatures whose min_length exceeds it
+    are dropped from the candidates before any of their patterns is tried.
+    """
+
+    def __init__(self, formats, signature_map, get_puid, priority_map=None, get_extensions=None):
+        """
+        Build the engine for `formats`.
+
+        `signature_map` maps each PUID to the tuple returned by compile_signatures
+        and `priority_map` maps each PUID to the PUIDs it has priority over.
+        `get_extensions` returns the extensions of a format, by default the
+        texts of its <extension> elements.
+        """
+        self.formats = formats
+        self.format_numbers = dict((format, number) for number, format in enumerate(formats))
+        puid_numbers = dict((get_puid(format), number) for number, format in enumerate(formats))
+        self.inferiors = []
+        for number, format in enumerate(formats):
+            mask = 0
+            for puid in (priority_map or {}).get(get_puid(format), ()):
+                inferior = puid_numbers.get(puid)
+                # A format never loses to itself
+                if inferior is not None and inferior != number:
+                    mask |= 1 << inferior
+            self.inferiors.append(mask)
+        self.signatures = []
+        for format in formats:
+            self.signatures.extend(signature_map.get(get_puid(format), ()))
+        extension_formats = {}
+        for format in formats:
+            for extension in set(extension.lower() for extension in (get_extensions or _extensions)(format) if extension):
+                extension_formats.setdefault(extension, []).append((format,))
+        self.extension_index = dict((extension, tuple(match[0] for match in self.undominated(matches)))
+                                    for extension, matches in extension_formats.items())
+        self.unindexed = []
+        prefix_index = {}
+        suffix_index = {}
+        for number, sig in enumerate(self.signatures):
+            prefix = sig.prefix()
+            suffix = sig.suffix() if prefix is None else None
+            if prefix is not None:
+                offset, literal = prefix
+                key = literal[:PREFIX_KEY_LENGTH]
+                prefix_index.setdefault((offset, len(key)), {}).setdefault(key, []).append(number)
+            elif suffix is not None:
+                distance, literal = suffix
+                key = literal[-PREFIX_KEY_LENGTH:]
+                suffix_index.setdefault((distance, len(key)), {}).setdefault(key, []).append(number)
+            else:
+                self.unindexed.append(number)
+        self.prefix_index = [(offset, offset + length, table, sorted(number for numbers in table.values() for number in numbers))
+                             for (offset, length), table in prefix_index.items()]
+        self.suffix_index = [(distance + length, distance, table) for (distance, length), table in suffix_index.items()]
+        suffix_indexed = [number for _, _, table in self.suffix_index for numbers in table.values() for number in numbers]
+        self.deferred_unindexed = sorted(number for number in self.unindexed + suffix_indexed
+                                         if not all(pattern.on_eof for pattern in self.signatures[number].patterns))
+        self.min_lengths = [sig.min_length for sig in self.signatures]
+        self.max_min_length = max(self.min_lengths or [0])
+        # The signatures that may be completed by a scan of the rest of a stream
+        self.scannable = frozenset(number for number, sig in enumerate(self.signatures) if any(pattern.span for pattern in sig.patterns))
+        patterns = [pattern for sig in self.signatures for pattern in sig.patterns]
+        self.bof_reach = _reach([pattern.reach if pattern.final else None for pattern in patterns if not pattern.on_eof])
+        self.eof_reach = _reach([pattern.window for pattern in patterns if pattern.on_eof])
+
+    def candidates(self, bofbuffer, eofbuffer, bof_complete=True, length=None):
+        """Return the numbers of the signatures that may match the buffers of a stream of length bytes, if known, in order."""
+        deferred = eofbuffer.__class__ is DeferredBuffer
+        numbers = list(self.deferred_unindexed if deferred else self.unindexed)
+        for start, end, table, indexed in self.prefix_index:
+            if not bof_complete and end > len(bofbuffer):
+                numbers.extend(indexed)
+                continue
+            hits = table.get(bytes(bofbuffer[start:end]))
+            if hits:
+                numbers.extend(hits)
+        size = 0 if deferred else len(eofbuffer)
+        for start, end, table in self.suffix_index:
+            if start <= size:
+                hits = table.get(bytes(eofbuffer[size - start:size - end]))
+                if hits:
+                    numbers.extend(hits)
+        if length is not None and length < self.max_min_length:
+            min_lengths = self.min_lengths
+            numbers = [number for number in numbers if min_lengths[number] <= length]
+        numbers.sort()
+        return numbers
+
+    def match(self, bofbuffer, eofbuffer, bof_complete=True, scan=None, length=None):
+        """
+        Return the matching signatures, in the order of the formats.
+
+        If `bof_complete` is False, `bofbuffer` only holds the first bytes of
+        the BOF buffer and None is returned when they do not decide every
+        candidate signature.
+        If `scan` is given, the signatures that only miss patterns with a span
+        in the BOF buffer are passed to it as a list of (signature, missing
+        patterns), see Signature.missing; it returns those of them whose
+        patterns are all found further on in the stream, which then match.
+        If `length` is given, it is the size of the stream, see candidates.
+        """
+        signatures = self.signatures
+        found = {}
+        result = []
+        undecided = []
+        for number in self.candidates(bofbuffer, eofbuffer, bof_complete, length):
+            matched = signatures[number].match(bofbuffer, eofbuffer, found, bof_complete)
+            if matched is None:
+                return None
+            if matched:
+                result.append(number)
+            elif scan is not None and number in self.scannable:
+                missing = signatures[number].missing(bofbuffer, eofbuffer, found)
+                if missing:
+                    undecided.append((number, missing))
+        if undecided:
+            scanned = set(scan([(signatures[number], missing) for number, missing in undecided]))
+            result = sorted(result + [number for number, _ in undecided if signatures[number] in scanned])
+        return [signatures[number] for number in result]
+
+    def best(self, matches):
+        """
+        Return the matches that no other match has priority over, in order.
+
+        `matches` is a list of tuples starting with a format.  A match is
+        dropped when a format of an earlier kept match has priority over it,
+        and finally when the format of any kept match has.
+        """
+        format_numbers = self.format_numbers
+        inferiors = self.inferiors
+        dominated = 0
+        result = []
+        for match in matches:
+            number = format_numbers[match[0]]
+            if not dominated >> number & 1:
+                result.append(match)
+                dominated |= inferiors[number]
+        return [match for match in result if not dominated >> format_numbers[match[0]] & 1]
+
+    def undominated(self, matches):
+        """
+        Return the matches that the format of no match has priority over, in order.
+
+        Unlike best(), every match counts, including the ones that are dropped.
+        """
+        format_numbers = self.format_numbers
+        inferiors = self.inferiors
+        dominated = 0
+        for match in matches:
+            dominated |= inferiors[format_numbers[match[0]]]
+        return [match for match in matches if not dominated >> format_numbers[match[0]] & 1]
+
+
+def _extensions(format):
+    """Return the extensions of a format element."""
+    return [extension.text for extension in format.findall('extension')]
+
+
+def _reach(reaches):
+    """Return the largest of a list of reaches, None if any is unbounded."""
+    return None if None in reaches else max(reaches or [0])
@@ -64,6 +64,7 @@ setup(
     package_data={'fido': ['*.*', 'conf/*.*', 'signatures/*.*', 'pronom/*.*']},
     entry_points={'console_scripts': [
         'fido = fido.fido:main',
+        'fido-client = fido.daemon:main',
         'fido-prepare = fido.prepare:main',
         'fido-update-signatures = fido.update_signatures:main',
         'fido-toxml = fido.toxml:main',
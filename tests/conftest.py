@@ -0,0 +1,44 @@
+"""Fixtures shared by the tests."""
+
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from fido.fido import Fido
+
+
+# A format whose single signature needs NEEDLE anywhere and END at the end of the file
+VAR_FORMAT_XML = """<format><puid>test/var</puid><name>Var</name><signature><name>Var</name>
+  <pattern><position>VAR</position><regex>(?s)NEEDLE</regex></pattern>
+  <pattern><position>EOF</position><regex>(?s)END.*\\Z</regex></pattern>
+</signature></format>"""
+
+
+@pytest.fixture
+def var_format_xml():
+    """Return the XML of the test/var format."""
+    return VAR_FORMAT_XML
+
+
+@pytest.fixture
+def make_fido():
+    """Return a function instantiating a Fido that only knows the format of format_xml, test/var by default."""
+    def make(format_xml=VAR_FORMAT_XML, **kwargs):
+        fido = Fido(format_files=[], **kwargs)
+        fido.process_format_element(ET.XML(format_xml))
+        return fido
+    return make
+
+
+@pytest.fixture
+def write_files(tmp_path):
+    """Return a function writing each of a list of contents to a file of tmp_path, returning their names."""
+    def write(contents):
+        filenames = []
+        for n, data in enumerate(contents):
+            filename = str(tmp_path / 'file{}'.format(n))
+            with open(filename, 'wb') as f:
+                f.write(data)
+            filenames.append(filename)
+        return filenames
+    return write
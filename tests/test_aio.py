@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from time import sleep
+
+import pytest
+
+from fido.aio import identify_many, identify_path
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_identify_path(tmp_path, make_fido):
+    filename = str(tmp_path / 'file.bin')
+    with open(filename, 'wb') as f:
+        f.write(b'a NEEDLE END')
+    fido = make_fido(nocontainer=True)
+    results = run(identify_path(fido, filename))
+    assert [(result.filename, result.puid) for result in results] == [(filename, 'test/var')]
+    results = run(identify_path(fido, ('buffer', b'nothing')))
+    assert [(result.filename, result.matchtype) for result in results] == [('buffer', 'fail')]
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_identify_many(ordered, make_fido):
+    fido = make_fido(nocontainer=True)
+    items = [('item{}'.format(n), b'NEEDLE END' if n % 3 else b'nothing') for n in range(30)]
+    running = [0, 0]  # identifications running, most at once
+    lock = threading.Lock()
+    identify = fido.identify
+
+    def counting_identify(*args, **kwargs):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        try:
+            sleep(0.01)
+            return list(identify(*args, **kwargs))
+        finally:
+            with lock:
+                running[0] -= 1
+
+    fido.identify = counting_identify
+
+    async def collect():
+        async def aitems():
+            for item in items:
+                yield item
+        return [result async for result in identify_many(fido, aitems(), concurrency=4, ordered=ordered)]
+
+    results = run(collect())
+    expected = [(name, 'test/var' if n % 3 else None) for n, (name, _) in enumerate(items)]
+    names = [(result.filename, result.puid) for result in results]
+    assert names == expected if ordered else sorted(names) == sorted(expected)
+    assert 1 < running[1] <= 4
@@ -0,0 +1,107 @@
+import os
+import pickle
+import sys
+
+from fido.cache import SignatureCache
+from fido.fido import Fido
+from fido.formats import FormatRecord
+from fido.signatures import LazyMatch
+
+
+def test_signature_cache(tmp_path, var_format_xml):
+    format_file = str(tmp_path / 'formats.xml')
+    with open(format_file, 'w') as f:
+        f.write('<formats>{}</formats>'.format(var_format_xml))
+    cache = SignatureCache(str(tmp_path / 'cache'))
+    fido = Fido(format_files=[format_file], signature_cache=cache)
+    assert not isinstance(fido.puid_signature_map['test/var'][0].patterns[0].test, LazyMatch)
+    assert len(os.listdir(cache.directory)) == 1
+
+    cached = Fido(format_files=[format_file], signature_cache=cache)
+    signature = cached.puid_signature_map['test/var'][0]
+    assert signature.format is cached.puid_format_map['test/var']
+    assert isinstance(signature.patterns[0].test, LazyMatch)
+    assert [name for _, name in cached.match_formats(b'a NEEDLE', b'END')] == ['Var']
+    assert not isinstance(signature.patterns[0].test, LazyMatch)
+    assert cached.match_formats(b'a NEEDLE', b'XYZ') == []
+
+    # A changed format file is compiled again, replacing its cached signatures
+    with open(format_file, 'w') as f:
+        f.write('<formats>{}</formats>'.format(var_format_xml.replace('NEEDLE', 'PIN')))
+    changed = Fido(format_files=[format_file], signature_cache=cache)
+    assert not isinstance(changed.puid_signature_map['test/var'][0].patterns[0].test, LazyMatch)
+    assert [name for _, name in changed.match_formats(b'a PIN', b'END')] == ['Var']
+    assert os.listdir(cache.directory) == [os.path.basename(cache.path(format_file, cache.digest(format_file)))]
+
+
+def test_signature_cache_regex_cache(tmp_path, var_format_xml):
+    format_file = str(tmp_path / 'formats.xml')
+    with open(format_file, 'w') as f:
+        # The two formats share their regexes
+        f.write('<formats>{}{}</formats>'.format(var_format_xml, var_format_xml.replace('test/var', 'test/var2')))
+    cache = SignatureCache(str(tmp_path / 'cache'))
+    Fido(format_files=[format_file], signature_cache=cache)
+    fido = Fido(format_files=[format_file], signature_cache=cache)
+    regex_cache = fido.regex_cache
+    assert (regex_cache.misses, regex_cache.hits) == (0, 0)
+    assert len(fido.match_formats(b'a NEEDLE', b'END')) == 2
+    assert (regex_cache.misses, regex_cache.hits) == (2, 2)
+    patterns = [sig.patterns for sigs in fido.puid_signature_map.values() for sig in sigs]
+    assert patterns[0][0].test == patterns[1][0].test
+
+    # So do the patterns of a pickled instance
+    copy = pickle.loads(pickle.dumps(Fido(format_files=[format_file], signature_cache=cache)))
+    assert len(copy.match_formats(b'a NEEDLE', b'END')) == 2
+    assert (copy.regex_cache.misses, copy.regex_cache.hits) == (2, 2)
+
+
+def test_signature_cache_same_basename(tmp_path, var_format_xml):
+    cache = SignatureCache(str(tmp_path / 'cache'))
+    format_files = []
+    for directory, needle in (('a', 'NEEDLE'), ('b', 'PIN')):
+        os.mkdir(str(tmp_path / directory))
+        format_files.append(str(tmp_path / directory / 'formats.xml'))
+        with open(format_files[-1], 'w') as f:
+            f.write('<formats>{}</formats>'.format(var_format_xml.replace('NEEDLE', needle)))
+    for format_file in format_files * 2:
+        Fido(format_files=[format_file], signature_cache=cache)
+    # Neither format file evicts the cache of the other
+    assert sorted(os.listdir(cache.directory)) == sorted(os.path.basename(cache.path(format_file, cache.digest(format_file)))
+                                                         for format_file in format_files)
+    cached = Fido(format_files=[format_files[1]], signature_cache=cache)
+    assert isinstance(cached.puid_signature_map['test/var'][0].patterns[0].test, LazyMatch)
+    # Python 2 and 3 do not share cache files
+    assert 'py{}'.format(sys.version_info[0]) in cache.header()
+
+
+def test_signature_cache_unwritable(tmp_path, var_format_xml):
+    format_file = str(tmp_path / 'formats.xml')
+    with open(format_file, 'w') as f:
+        f.write('<formats>{}</formats>'.format(var_format_xml))
+    (tmp_path / 'file').write_text(u'')
+    fido = Fido(format_files=[format_file], signature_cache=SignatureCache(str(tmp_path / 'file' / 'cache')))
+    assert [name for _, name in fido.match_formats(b'a NEEDLE', b'END')] == ['Var']
+
+
+def test_format_database(tmp_path, var_format_xml):
+    format_file = str(tmp_path / 'formats.xml')
+    with open(format_file, 'w') as f:
+        f.write('<formats>{}</formats>'.format(var_format_xml.replace(
+            '<name>Var</name>', '<name>Var</name><extension>var</extension><extension>v</extension><has_priority_over>test/x</has_priority_over>'
+            '<details><description>Long text</description></details>')))
+    cache = SignatureCache(str(tmp_path / 'cache'))
+    Fido(format_files=[format_file], signature_cache=cache)
+    fido = Fido(format_files=[format_file], signature_cache=cache)
+    record = fido.puid_format_map['test/var']
+    assert isinstance(record, FormatRecord)
+    assert fido.formats == [record]
+    assert fido.puid_has_priority_over_map['test/var'] == frozenset(['test/x'])
+    assert [name for _, name in fido.match_extensions('file.v')] == ['External']
+    assert fido.get_puid(record) == 'test/var'
+    assert record._element is None
+    assert record.findtext('details/description') == 'Long text'
+    assert [child.tag for child in record][:2] == ['puid', 'name']
+    copy = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+    assert copy._element is None
+    assert copy.findtext('name') == 'Var'
+    assert [child.text for child in copy.findall('extension')] == ['var', 'v']
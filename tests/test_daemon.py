@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+from fido.daemon import Client, DaemonError, IdentificationServer
+
+
+@pytest.fixture
+def client(tmp_path, make_fido):
+    fido = make_fido(printmatch='%(info.filename)s %(info.puid)s %(info.filesize)s\n', printnomatch='%(info.filename)s fail\n', nocontainer=True)
+    server = IdentificationServer(fido, str(tmp_path / 'fido.sock'))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    client = Client(str(tmp_path / 'fido.sock'))
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_daemon_requests(client, tmp_path):
+    filename = str(tmp_path / 'file.bin')
+    with open(filename, 'wb') as f:
+        f.write(b'a NEEDLE END')
+    assert client.identify_path(filename) == '{} test/var 12\n'.format(filename)
+    assert client.identify_bytes(b'NEEDLE END', 'data.bin') == 'data.bin test/var 10\n'
+    assert client.identify_bytes(b'nothing', 'data.bin') == 'data.bin fail\n'
+    assert client.identify_bytes(b'nothing', 'data.bin', extension=False) == ''
+    with pytest.raises(DaemonError):
+        client.identify_path(str(tmp_path / 'missing'))
+    # The connection is still usable after an error
+    assert client.identify_bytes(b'NEEDLE' + b'x' * 300000 + b' END', 'big.bin') == 'big.bin test/var 300010\n'
@@ -1,9 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import io
+import threading
 from time import sleep
 
-from fido.fido import PerfTimer
+import pytest
+
+from fido import fido as fido_module, package
+from fido.fido import Fido, PerfTimer
+from fido.package import ZipPackage
+from fido.signatures import DeferredBuffer
 
 
 def test_perf_timer():
@@ -11,3 +18,252 @@ def test_perf_timer():
     sleep(3.6)
     duration = timer.duration()
     assert duration > 0
+
+
+@pytest.mark.parametrize('length', [0, 3, 8, 11, 16, 17, 40])
+def test_get_buffers_lazy_eof(length, make_fido):
+    data = bytes(bytearray(range(length)))
+    eager = make_fido(bufsize=8)
+    lazy = make_fido(bufsize=8, lazy_eof=True)
+    expected = eager.get_buffers(io.BytesIO(data), length)
+    assert eager.get_buffers(io.BytesIO(data), length, seekable=True) == expected
+    bofbuffer, eofbuffer, bytes_read = lazy.get_buffers(io.BytesIO(data), length, seekable=True)
+    if length > 8:
+        assert isinstance(eofbuffer, DeferredBuffer)
+        eofbuffer = eofbuffer()
+    assert (bofbuffer, eofbuffer, bytes_read) == expected
+
+
+@pytest.mark.parametrize('length', [0, 3, 5, 8, 11, 40])
+def test_get_buffers_signature_reach(length, make_fido):
+    fido = make_fido("""<format><puid>test/reach</puid><signature><name>Reach</name>
+      <pattern><position>BOF</position><regex>(?s)\\Aab.{0,2}c</regex></pattern>
+      <pattern><position>EOF</position><regex>(?s)ab.{2}\\Z</regex></pattern>
+    </signature></format>""", bufsize=8)
+    assert fido.get_read_sizes() == (5, 4)
+    data = bytes(bytearray(range(length)))
+    for seekable in (False, True):
+        bofbuffer, eofbuffer, _ = fido.get_buffers(io.BytesIO(data), length, seekable)
+        assert bofbuffer == data[:5]
+        assert eofbuffer == (data if length <= 5 else data[-4:])
+
+
+class ShortReads(object):
+    """A stream that cannot seek, returning at most 3 bytes per read like a pipe."""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.stream.read(min(size, 3))
+
+
+@pytest.mark.parametrize('length', [0, 5, 8, 13, 16, 40])
+def test_get_buffers_short_reads(length, make_fido):
+    data = bytes(bytearray(range(length)))
+    fido = make_fido(bufsize=8)
+    assert fido.get_buffers(ShortReads(data)) == (data[:8], data[-8:], length)
+    assert fido.get_buffers(ShortReads(data), length) == (data[:8], data[-8:], min(length, 8))
+    assert fido.get_buffers(io.BytesIO(data)) == (data[:8], data[-8:], length)
+
+
+def test_match_stream_read_step(make_fido, var_format_xml):
+    data = b'x' * 1000 + b'NEEDLE' + b'x' * 1000 + b'END'
+    fido = make_fido(var_format_xml.replace('END.*', 'END'), bufsize=4096, read_step=16)
+    reads = []
+    stream = io.BytesIO(data)
+    readinto = stream.readinto
+    stream.readinto = lambda view: reads.append(len(view)) or readinto(view)
+    matches = fido.match_stream(stream, len(data), seekable=True)
+    assert [name for _, name in matches] == ['Var']
+    assert sum(reads) < len(data)
+    assert fido.match_stream(io.BytesIO(data.replace(b'NEEDLE', b'needle')), len(data), seekable=True) == []
+    assert fido.match_stream(io.BytesIO(data[:-3]), len(data) - 3, seekable=True) == []
+
+
+def test_match_stream_read_step_short_stream(make_fido, var_format_xml):
+    # The stream ends before its length, as a file truncated since its size was taken
+    data = b'x' * 1000 + b'NEEDLE'
+    fido = make_fido(var_format_xml.replace('<pattern><position>EOF</position><regex>(?s)END.*\\Z</regex></pattern>', ''), bufsize=4096, read_step=16)
+    matches = fido.match_stream(io.BytesIO(data), len(data) + 200000, seekable=True)
+    assert [name for _, name in matches] == ['Var']
+    assert fido.match_stream(io.BytesIO(data[:-1]), len(data) + 200000, seekable=True) == []
+
+
+def test_container_signatures_parsed_once(monkeypatch):
+    fido = Fido(format_files=[])
+    parses = []
+    parse = fido_module.ET.parse
+    monkeypatch.setattr(fido_module.ET, 'parse', lambda source: parses.append(source) or parse(source))
+    zip_signatures = fido.get_container_signatures('ZIP')
+    assert fido.get_container_signatures('OLE2')
+    assert fido.get_container_signatures('ZIP') is zip_signatures
+    assert len(parses) == 1
+    signature = zip_signatures['[Content_Types].xml']['fmt/412'][0]
+    assert signature['regex'].pattern == signature['signature']
+    assert signature['overlap'] == package.signature_overlap(signature['signature'])
+    # The regexes are not analysed again for each container
+    monkeypatch.setattr(package, 'parse_regex', None)
+    assert ZipPackage('file.zip', zip_signatures, fido.regex_cache, 4096).overlaps['[Content_Types].xml'] is not None
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_identify_files_workers(capsys, ordered, make_fido, write_files):
+    filenames = write_files([b'NEEDLE END' if n % 3 else b'nothing' for n in range(20)])
+    fido = make_fido(printmatch='%(info.filename)s %(info.puid)s\n', printnomatch='%(info.filename)s fail\n', nocontainer=True)
+    fido.identify_files(filenames, extension=False)
+    expected = capsys.readouterr().out
+    fido.identify_files(filenames, extension=False, workers=2, ordered=ordered)
+    output = capsys.readouterr().out
+    if ordered:
+        assert output == expected
+    else:
+        assert sorted(output.splitlines()) == sorted(expected.splitlines())
+    assert fido.current_count == 40
+
+
+def test_identify_files_workers_handler(capsys, make_fido, write_files):
+    filenames = write_files([b'NEEDLE END' if n % 3 else b'nothing' for n in range(20)])
+    calls = []
+
+    def handle_matches(fullname, matches, delta_t, matchtype=''):
+        calls.append((fullname, [(format, sig_name) for format, sig_name in matches], matchtype, fido.context.filesize))
+
+    fido = make_fido(handle_matches=handle_matches, nocontainer=True)
+    fido.identify_files(filenames, extension=False)
+    expected = calls[:]
+    del calls[:]
+    fido.identify_files(filenames, extension=False, workers=2)
+    assert calls == expected
+    assert calls[1][1][0][0] is fido.puid_format_map['test/var']
+    assert capsys.readouterr().out == ''
+
+
+def test_identify_files_prefetch(tmp_path, capsys, make_fido, write_files):
+    filenames = write_files([b'NEEDLE END' if n % 3 else b'nothing' for n in range(20)])
+    filenames.append(str(tmp_path / 'missing'))
+    fido = make_fido(printmatch='%(info.filename)s %(info.puid)s\n', printnomatch='%(info.filename)s fail\n', nocontainer=True)
+    fido.identify_files(filenames, extension=False)
+    expected = capsys.readouterr()
+    fido.identify_files(filenames, extension=False, prefetch=3)
+    output = capsys.readouterr()
+    assert output.out == expected.out
+    assert output.err == expected.err
+    assert 'missing' in output.err
+
+
+def test_identify_files_prefetch_error(tmp_path, make_fido):
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb') as f:
+        f.write(b'NEEDLE END')
+    fido = make_fido(nocontainer=True)
+
+    def read_buffers(filename):
+        raise ValueError('unreadable')
+
+    fido.read_buffers = read_buffers
+    with pytest.raises(ValueError, match='unreadable'):
+        fido.identify_files([filename], extension=False, prefetch=2)
+
+
+def test_identify_file_threads(make_fido, write_files):
+    filenames = write_files([(b'NEEDLE' if n % 2 else b'x') * (n + 1) + b' END' for n in range(40)])
+    results = {}
+
+    def handle_matches(filename, matches, delta_t, matchtype=''):
+        sleep(0.001)
+        results[filename] = (fido.context.filename, fido.current_filesize, [name for _, name in matches])
+
+    fido = make_fido(handle_matches=handle_matches, nocontainer=True)
+
+    def identify(names):
+        for name in names:
+            fido.identify_file(name, extension=False)
+
+    threads = [threading.Thread(target=identify, args=(filenames[n::4],)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for n, filename in enumerate(filenames):
+        if n % 2:
+            assert results[filename] == (filename, 6 * (n + 1) + 4, ['Var'])
+        else:
+            assert filename not in results
+    assert fido.current_count == 40
+
+
+def test_identify_results(tmp_path, make_fido, var_format_xml):
+    filename = str(tmp_path / 'file.bin')
+    with open(filename, 'wb') as f:
+        f.write(b'a NEEDLE END')
+    calls = []
+    fido = make_fido(var_format_xml.replace('<name>Var</name><signature>', '<name>Var</name><extension>var</extension><signature>'),
+                     handle_matches=lambda *args: calls.append(args), nocontainer=True)
+    with open(filename, 'rb') as f:
+        results = list(fido.identify([filename, f, b'NEEDLE END', ('data.var', b'nothing'), bytearray(b'nothing')]))
+    assert [result[:5] for result in results] == [
+        (filename, 'test/var', 'Var', 'Var', 'signature'),
+        (filename, 'test/var', 'Var', 'Var', 'signature'),
+        ('', 'test/var', 'Var', 'Var', 'signature'),
+        ('data.var', 'test/var', 'Var', 'External', 'extension'),
+        ('', None, None, None, 'fail'),
+    ]
+    assert [result.filesize for result in results] == [12, 12, 10, 7, 7]
+    assert all(result.time >= 0 for result in results)
+    assert calls == []
+    fido.identify_file(filename)
+    assert len(calls) == 1
+
+
+def test_identify_file_mmap(make_fido, write_files):
+    contents = [b'', b'a NEEDLE END', b'a needle END', b'NEEDLE' + b'x' * 100 + b'END', b'x' * 100 + b'NEEDLE END']
+    filenames = write_files(contents)
+    results = {}
+    for use_mmap in (False, True):
+        fido = make_fido(bufsize=64, nocontainer=True, use_mmap=use_mmap)
+        for filename in filenames:
+            results.setdefault(use_mmap, []).append([result[1:5] for result in fido.identify([filename], extension=False)])
+    assert results[True] == results[False]
+    assert [bool(matches) for matches in results[True]] == [False, True, False, True, False]
+
+
+def test_identify_file_mmap_fallback(tmp_path, monkeypatch, make_fido):
+    def failing_mmap(*args, **kwargs):
+        raise fido_module.mmap.error(19, 'No such device')
+
+    monkeypatch.setattr(fido_module.mmap, 'mmap', failing_mmap)
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb') as f:
+        f.write(b'a NEEDLE END')
+    fido = make_fido(bufsize=64, nocontainer=True, use_mmap=True)
+    assert [result.puid for result in fido.identify([filename], extension=False)] == ['test/var']
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_var_scan(use_mmap, make_fido, write_files):
+    contents = [
+        (b'NEEDLE' + b'x' * 40 + b' END', True),
+        (b'x' * 13 + b'NEEDLE' + b'x' * 40 + b' END', True),
+        (b'x' * 19 + b'NEEDLE' + b'x' * 40 + b' END', True),
+        (b'x' * 40 + b'NEEDLE END', True),
+        (b'x' * 40 + b'NEEDLE', False),
+        (b'x' * 60 + b' END', False),
+    ]
+    plain = make_fido(bufsize=16, nocontainer=True, use_mmap=use_mmap)
+    scanning = make_fido(bufsize=16, container_bufsize=8, nocontainer=True, use_mmap=use_mmap, var_scan=True)
+    filenames = write_files([data for data, _ in contents])
+    for n, (filename, (_, matched)) in enumerate(zip(filenames, contents)):
+        assert [result.signaturename for result in scanning.identify([filename], extension=False)] == (['Var'] if matched else [])
+        assert [result.signaturename for result in plain.identify([filename], extension=False)] == (['Var'] if n == 0 else [])
+
+
+def test_var_scan_stops_when_decided(make_fido):
+    data = b'x' * 20 + b'NEEDLE' + b'x' * 1000 + b'END'
+    fido = make_fido(bufsize=16, container_bufsize=8, var_scan=True)
+    reads = []
+    stream = io.BytesIO(data)
+    readinto = stream.readinto
+    stream.readinto = lambda view: reads.append(len(view)) or readinto(view)
+    assert [name for _, name in fido.match_stream(stream, len(data), seekable=True)] == ['Var']
+    assert sum(reads) < 100
@@ -0,0 +1,42 @@
+import pickle
+
+import pytest
+
+from fido.cache import SignatureCache
+from fido.fido import Fido
+from fido.formats import FormatRecord
+
+
+@pytest.fixture
+def described_format_xml(var_format_xml):
+    return var_format_xml.replace(
+        '<name>Var</name>', '<name>Var</name><version>2</version><alias /><apple_uti>public.var</apple_uti>'
+        '<mime>text/x-var</mime><mime>application/x-var</mime><details><description>Long text</description></details>', 1)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_format_records(tmp_path, cached, described_format_xml):
+    format_file = str(tmp_path / 'formats.xml')
+    with open(format_file, 'w') as f:
+        f.write('<formats>{}</formats>'.format(described_format_xml))
+    cache = SignatureCache(str(tmp_path / 'cache')) if cached else False
+    if cached:
+        Fido(format_files=[format_file], signature_cache=cache)
+    fido = Fido(format_files=[format_file], signature_cache=cache,
+                printmatch='%(info.puid)s,%(info.mimetype)s,%(info.version)s,%(info.alias)s,%(info.apple_uti)s\n')
+    record = fido.puid_format_map['test/var']
+    assert isinstance(record, FormatRecord)
+    assert record.mimes == ('text/x-var', 'application/x-var')
+    assert (record.version, record.alias, record.apple_uti, record.container) == ('2', '', 'public.var', None)
+    assert record.find('alias').text is None
+    assert record.findtext('alias') == ''
+    assert record.find('container') is None
+    assert record.findtext('container', 'none') == 'none'
+    fido.context.filesize = 8
+    assert fido.format_matches('file', [(record, 'Var')], 0) == 'test/var,text/x-var,2,None,public.var\n'
+    assert record._element is None
+
+    assert record.findtext('details/description') == 'Long text'
+    copy = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+    assert copy._element is None
+    assert copy.findtext('details/description') == 'Long text'
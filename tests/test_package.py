@@ -1,6 +1,10 @@
+import io
 import os
+import zipfile
 
-from fido.package import ZipPackage
+from fido import package
+from fido.package import OlePackage, ZipPackage
+from fido.signatures import RegexCache
 
 
 FIXTURES_DIR = os.path.normpath(os.path.join(__file__, '..', 'fixtures'))
@@ -11,3 +15,70 @@ def test_bad_zips():
         p = ZipPackage(os.path.join(FIXTURES_DIR, filename), {})
         r = p.detect_formats()
         assert isinstance(r, list) and len(r) == 0
+
+
+def test_zip_regex_cache():
+    signatures = {'foo/a': {'test/a': [{'signature': b'(?s)\\AA'}]}, 'foo/b': {'test/b': [{'signature': b'(?s)\\AA'}]}}
+    cache = RegexCache()
+    for _ in range(2):
+        p = ZipPackage(os.path.join(FIXTURES_DIR, 'foo.zip'), signatures, cache)
+        assert p.detect_formats() == ['test/a']
+    assert (cache.misses, cache.hits) == (1, 3)
+
+
+class FakeOleFile(object):
+    streams = {'\x01CompObj': b'Word.Document', 'Data/Header': b'Header', 'CompObj': b'Other'}
+    opened = []
+
+    def __init__(self, filename):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def listdir(self):
+        return [path.split('/') for path in self.streams]
+
+    def openstream(self, path):
+        self.opened.append(path)
+        return io.BytesIO(self.streams[path])
+
+
+def test_ole_stream_lookup(monkeypatch):
+    monkeypatch.setattr(package.olefile, 'OleFileIO', FakeOleFile)
+    signatures = {'CompObj': {'test/word': [{'signature': b'Word'}]}, 'Data/Header': {'test/header': [{'signature': b'Head'}]},
+                  'Missing': {'test/missing': [{'signature': b''}]}}
+    assert sorted(OlePackage('file.ole', signatures).detect_formats()) == ['test/header', 'test/word']
+    # The first stream listed under a name is used
+    assert FakeOleFile.opened == ['\x01CompObj', 'Data/Header']
+
+
+def test_zip_chunked_reads(tmp_path):
+    path = str(tmp_path / 'test.zip')
+    with zipfile.ZipFile(path, 'w') as zip_:
+        zip_.writestr('doc.xml', b'x' * 10 + b'NEEDLE' + b'y' * 1000)
+    signatures = {'doc.xml': {'test/a': [{'signature': b'(?s)NEEDLE'}], 'test/b': [{'signature': b'(?s)y{3}\\Z|MISSING'}]}}
+    assert ZipPackage(path, signatures).detect_formats() == ['test/a', 'test/b']
+    # The needle straddles the first two chunks
+    assert ZipPackage(path, {'doc.xml': {'test/a': signatures['doc.xml']['test/a']}}, bufsize=12).detect_formats() == ['test/a']
+    reads = []
+    read = zipfile.ZipExtFile.read
+
+    def counting_read(self, n=-1):
+        data = read(self, n)
+        reads.append(len(data))
+        return data
+
+    zipfile.ZipExtFile.read = counting_read
+    try:
+        # Anchored regexes are matched against the whole file
+        assert ZipPackage(path, signatures, bufsize=12).detect_formats() == ['test/a', 'test/b']
+        assert sum(reads) == 1016
+        del reads[:]
+        assert ZipPackage(path, {'doc.xml': {'test/a': signatures['doc.xml']['test/a']}}, bufsize=12).detect_formats() == ['test/a']
+        assert sum(reads) == 24
+    finally:
+        zipfile.ZipExtFile.read = read
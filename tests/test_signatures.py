@@ -0,0 +1,232 @@
+from xml.etree import ElementTree as ET
+
+import pytest
+from six import PY2
+
+from fido.signatures import (bounded_head, compile_signatures, contains, DeferredBuffer, literal_byte, literal_fragments, literal_prefix, literal_suffix, parse_regex, Pattern,
+                             RegexCache, SignatureEngine)
+
+
+FORMAT_XML = """<format>
+  <puid>test/1</puid>
+  <signature>
+    <name>Good</name>
+    <pattern><position>BOF</position><regex>(?s)\\AGOOD</regex></pattern>
+    <pattern><position>EOF</position><regex>(?s)END\\Z</regex></pattern>
+  </signature>
+  <signature>
+    <name>Broken</name>
+    <pattern><position>BOF</position><regex>(?s)\\A.{10,2}X</regex></pattern>
+  </signature>
+</format>"""
+
+
+def test_compile_signatures_skips_broken_regex():
+    format_ = ET.XML(FORMAT_XML)
+    signatures = compile_signatures(format_, 'test/1')
+    assert [sig.name for sig in signatures] == ['Good']
+    assert signatures[0].format is format_
+    assert signatures[0].puid == 'test/1'
+
+
+def test_compile_signatures_regex_cache():
+    cache = RegexCache()
+    first = compile_signatures(ET.XML(FORMAT_XML), 'test/1', cache)
+    misses = cache.misses
+    second = compile_signatures(ET.XML(FORMAT_XML), 'test/1', cache)
+    # Only the regex that fails to compile is compiled again
+    assert cache.misses == misses + 1
+    assert cache.hits == misses - 1
+    assert first[0].patterns[0].test == second[0].patterns[0].test
+
+
+def test_signature_match():
+    format_ = ET.XML(FORMAT_XML)
+    engine = SignatureEngine([format_], {'test/1': compile_signatures(format_, 'test/1')}, lambda f: f.findtext('puid'))
+    assert [sig.name for sig in engine.match(b'GOOD data', b'data END')] == ['Good']
+    assert engine.match(b'GOOD data', b'END data') == []
+    assert engine.match(b'BAD data', b'data END') == []
+
+
+def test_zero_width_atoms_are_not_literals():
+    assert [literal_byte(atom) for atom in parse_regex(b'(?s)\\Aa(?=b)\\Z')] == [None, b'a', None, None]
+    assert literal_prefix(parse_regex(b'(?s)\\A\\x89PNG')) == (0, b'\x89PNG')
+    assert literal_suffix(parse_regex(b'(?s)IEND\\Z')) == (0, b'IEND')
+    assert literal_fragments(parse_regex(b'(?s)ab(?=c)de')) == (b'ab', b'de')
+    format_ = ET.XML(FORMAT_XML)
+    engine = SignatureEngine([format_], {'test/1': compile_signatures(format_, 'test/1')}, lambda f: f.findtext('puid'))
+    assert engine.candidates(b'GOOD data', b'') == [0]
+
+
+def test_literal_prefix():
+    assert literal_prefix(parse_regex(b'(?s)\\APK\\x03\\x04')) == (0, b'PK\x03\x04')
+    assert literal_prefix(parse_regex(b'(?s)\\A.{30}\\[Content_Types\\]\\.xml \\xa2')) == (30, b'[Content_Types].xml \xa2')
+    assert literal_prefix(parse_regex(b'(?s)\\A(?:\\xc1|\\x00).{2}ab.?c')) == (3, b'ab')
+    assert literal_prefix(parse_regex(b'(?s)\\A.{0,4}ab')) is None
+    assert literal_prefix(parse_regex(b'(?s)\\A[\\x01-\\x1c]')) is None
+
+
+def test_prefix_index_candidates():
+    format_ = ET.XML(FORMAT_XML)
+    engine = SignatureEngine([format_], {'test/1': compile_signatures(format_, 'test/1')}, lambda f: f.findtext('puid'))
+    assert engine.unindexed == []
+    assert engine.candidates(b'GOOD data', b'') == [0]
+    assert engine.candidates(b'GOO', b'') == []
+
+
+def test_min_length_candidates():
+    format_ = ET.XML("""<format><puid>test/5</puid>
+      <signature><name>Offset</name><pattern><position>BOF</position><regex>(?s)\\A.{512}[AB]{3}</regex></pattern></signature>
+      <signature><name>Both</name><pattern><position>BOF</position><regex>(?s)\\Aab(?:cd|e)</regex></pattern>
+        <pattern><position>EOF</position><regex>(?s)wx.{1,8}yz\\Z</regex></pattern></signature>
+      <signature><name>Var</name><pattern><position>VAR</position><regex>(?s)a.*b</regex></pattern></signature>
+    </format>""")
+    signatures = compile_signatures(format_, 'test/5')
+    assert [sig.min_length for sig in signatures] == [515, 5, 2]
+    engine = SignatureEngine([format_], {'test/5': signatures}, lambda f: f.findtext('puid'))
+    assert engine.candidates(b'abe', b'abe') == [0, 1, 2]
+    assert engine.candidates(b'abe', b'abe', length=3) == [2]
+    assert engine.candidates(b'abe', b'abe', length=5) == [1, 2]
+    assert engine.candidates(b'abe', b'abe', length=600) == [0, 1, 2]
+
+
+def test_literal_fragments():
+    assert literal_fragments(parse_regex(b'(?s)Microsoft \\(R\\) PowerPoint.{2}(?:\\x00|\\x01)_x')) == (b'Microsoft (R) PowerPoint', b'_x')
+    assert literal_fragments(parse_regex(b'(?s)ab(?!c)de.*fgh')) == (b'fgh', b'ab', b'de')
+    assert Pattern('VAR', b'(?s)P\\x00P\\x004').fragments == (b'P\x00P\x004',)
+    assert Pattern('BOF', b'(?s)\\AP\\x00P\\x004').fragments == ()
+
+
+def test_literal_suffix():
+    assert literal_suffix(parse_regex(b'(?s)%%EOF(?:\\r|\\n)\\Z')) == (1, b'%%EOF')
+    assert literal_suffix(parse_regex(b'(?s)%%EOF(?:\\r|\\r\\n)\\Z')) is None
+    assert literal_suffix(parse_regex(b'(?s)\\x01\\x00\\x00\\x00\\Z')) == (0, b'\x01\x00\x00\x00')
+    assert literal_suffix(parse_regex(b'(?s)TRUEVISION-XFILE\\.\\x00.{2}\\Z')) == (2, b'TRUEVISION-XFILE.\x00')
+    assert literal_suffix(parse_regex(b'(?s)abc')) is None
+
+
+def test_eof_window():
+    pattern = Pattern('EOF', b'(?s)E(?:N|n)D.{0,1};.{0,20}\\Z')
+    assert pattern.window == 25
+    pattern = Pattern('EOF', b'(?s)END.*\\Z')
+    assert pattern.window is None
+
+
+def test_suffix_index_candidates():
+    format_ = ET.XML('''<format><puid>test/2</puid><signature><name>Trailer</name>
+      <pattern><position>EOF</position><regex>(?s)TRAILER.{2}\\Z</regex></pattern>
+    </signature></format>''')
+    engine = SignatureEngine([format_], {'test/2': compile_signatures(format_, 'test/2')}, lambda f: f.findtext('puid'))
+    assert engine.unindexed == []
+    assert engine.candidates(b'', b'data TRAILER..') == [0]
+    assert engine.candidates(b'', b'data TRAILER...') == []
+    assert [sig.name for sig in engine.match(b'', b'data TRAILER..')] == ['Trailer']
+
+
+def test_deferred_eof_buffer():
+    reads = []
+
+    def read_eof():
+        reads.append(True)
+        return b'data END'
+
+    format_ = ET.XML(FORMAT_XML)
+    engine = SignatureEngine([format_], {'test/1': compile_signatures(format_, 'test/1')}, lambda f: f.findtext('puid'))
+    assert engine.match(b'BAD data', DeferredBuffer(read_eof)) == []
+    assert reads == []
+    assert [sig.name for sig in engine.match(b'GOOD data', DeferredBuffer(read_eof))] == ['Good']
+    assert reads == [True]
+
+
+def test_deferred_eof_skips_eof_only_signatures():
+    format_ = ET.XML('''<format><puid>test/2</puid><signature><name>Trailer</name>
+      <pattern><position>EOF</position><regex>(?s)TRAILER\\Z</regex></pattern>
+    </signature></format>''')
+    engine = SignatureEngine([format_], {'test/2': compile_signatures(format_, 'test/2')}, lambda f: f.findtext('puid'))
+    assert engine.match(b'', DeferredBuffer(lambda: b'TRAILER')) == []
+    assert len(engine.match(b'', b'TRAILER')) == 1
+
+
+def test_bof_reach():
+    assert Pattern('BOF', b'(?s)\\A.{4}ab(?:c|de)').reach == 8
+    assert Pattern('BOF', b'(?s)\\Aab.*c').reach is None
+    assert Pattern('BOF', b'(?s)\\Aab(?!c)').reach is None
+    assert Pattern('BOF', b'(?s)\\Aab\\Z').reach is None
+    assert Pattern('VAR', b'(?s)ab').reach is None
+
+
+def test_partial_bof_buffer():
+    format_ = ET.XML(FORMAT_XML)
+    engine = SignatureEngine([format_], {'test/1': compile_signatures(format_, 'test/1')}, lambda f: f.findtext('puid'))
+    assert engine.bof_reach == 4
+    assert engine.match(b'GOO', b'data END', bof_complete=False) is None
+    assert engine.match(b'GOO', b'data END') == []
+    assert [sig.name for sig in engine.match(b'GOOD', b'data END', bof_complete=False)] == ['Good']
+    var = ET.XML("""<format><puid>test/3</puid><signature><name>Var</name>
+      <pattern><position>VAR</position><regex>(?s)NEEDLE</regex></pattern>
+      <pattern><position>EOF</position><regex>(?s)END\\Z</regex></pattern>
+    </signature></format>""")
+    engine = SignatureEngine([var], {'test/3': compile_signatures(var, 'test/3')}, lambda f: f.findtext('puid'))
+    assert engine.bof_reach is None
+    assert engine.eof_reach == 3
+    assert [sig.name for sig in engine.match(b'a NEEDLE', b'END', bof_complete=False)] == ['Var']
+    assert engine.match(b'a NEED', b'END', bof_complete=False) is None
+    assert engine.match(b'a NEED', b'XYZ', bof_complete=False) == []
+
+
+def test_bounded_head():
+    assert bounded_head(b'(?s)\\A(?:s| s)olid .*facet') == b'(?s)\\A(?:s| s)olid '
+    assert bounded_head(b'\\Aab{2,}') == b'\\Aa'
+    assert bounded_head(b'(?s)\\A.*ab') is None
+    assert bounded_head(b'\\A\\Z') is None
+
+
+def test_partial_bof_buffer_unbounded_pattern():
+    format_ = ET.XML("""<format><puid>test/4</puid><signature><name>Solid</name>
+      <pattern><position>BOF</position><regex>(?s)\\Asolid .*facet</regex></pattern>
+    </signature><signature><name>Empty</name>
+      <pattern><position>BOF</position><regex>\\A\\Z</regex></pattern>
+    </signature></format>""")
+    engine = SignatureEngine([format_], {'test/4': compile_signatures(format_, 'test/4')}, lambda f: f.findtext('puid'))
+    assert engine.bof_reach is None
+    assert engine.match(b'solid x', b'', bof_complete=False) is None
+    assert engine.match(b'liquid x', b'', bof_complete=False) == []
+    assert [sig.name for sig in engine.match(b'solid facet', b'', bof_complete=False)] == ['Solid']
+
+
+def test_best_matches():
+    formats = [ET.XML('<format><puid>test/{}</puid></format>'.format(n)) for n in range(4)]
+    priority_map = {'test/0': frozenset(['test/1', 'test/0']), 'test/1': frozenset(['test/2']), 'test/3': frozenset(['test/0'])}
+    engine = SignatureEngine(formats, {}, lambda f: f.findtext('puid'), priority_map)
+    a, b, c, d = [(format, 'sig') for format in formats]
+    assert engine.best([a, a]) == [a, a]
+    assert engine.best([a, b]) == [a]
+    assert engine.best([b, a]) == [a]
+    # Priority is not transitive
+    assert engine.best([a, c]) == [a, c]
+    # A match dropped at the end still decides what is kept before it
+    assert engine.best([a, d, b]) == [d]
+
+
+def test_extension_index():
+    extensions = [['doc', 'DOC'], ['Doc'], ['txt', ''], ['doc']]
+    formats = [ET.XML('<format><puid>test/{}</puid>{}</format>'.format(n, ''.join('<extension>{}</extension>'.format(e) for e in exts)))
+               for n, exts in enumerate(extensions)]
+    engine = SignatureEngine(formats, {}, lambda f: f.findtext('puid'), {'test/1': frozenset(['test/3'])})
+    assert engine.extension_index == {'doc': (formats[0], formats[1]), 'txt': (formats[2],)}
+
+
+def test_extension_index_priority_chain():
+    # test/0 has priority over test/1, which has priority over test/2
+    formats = [ET.XML('<format><puid>test/{}</puid><extension>foo</extension></format>'.format(n)) for n in range(3)]
+    engine = SignatureEngine(formats, {}, lambda f: f.findtext('puid'), {'test/0': frozenset(['test/1']), 'test/1': frozenset(['test/2'])})
+    assert engine.extension_index == {'foo': (formats[0],)}
+
+
+@pytest.mark.skipif(PY2, reason='The re module of Python 2 cannot search memoryviews')
+def test_contains_memoryview():
+    buffer = bytearray(b'xxNEEDLEyy')
+    assert contains(bytes(buffer), b'NEEDLE')
+    assert contains(memoryview(buffer), b'NEEDLE')
+    assert not contains(memoryview(buffer)[:6], b'NEEDLE')
+    assert not contains(memoryview(buffer), b'x.y')